@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Замер времени запуска Telegram бота "Платон" до первого ответа
+
+Бот запускается отдельным процессом в режиме вебхука и работает с локальной
+заменой Bot API (getMe, sendMessage и т.д. обслуживаются этим скриптом).
+Замеряется время от запуска процесса до ответа /health и до отправки ботом
+первого сообщения в ответ на /start.
+
+Пример:
+    python benchmark_startup.py --runs 5
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+BOT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'telegram_bot.py')
+CHAT = {'id': 1, 'type': 'private'}
+USER = {'id': 1, 'is_bot': False, 'first_name': 'Benchmark'}
+
+
+class FakeBotApi(ThreadingHTTPServer):
+    """Локальная замена Bot API: отвечает на методы, которые вызывает бот"""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FakeBotApiHandler)
+        self.sent_messages = []
+        self.message_sent = threading.Event()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class FakeBotApiHandler(BaseHTTPRequestHandler):
+    """Обработчик запросов к локальной замене Bot API"""
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0) or 0)
+        self.rfile.read(length)
+        method = self.path.rsplit('/', 1)[-1]
+
+        if method == 'getMe':
+            result = {'id': 100, 'is_bot': True, 'first_name': 'Platon', 'username': 'platon_benchmark_bot'}
+        elif method in ('sendMessage', 'editMessageText'):
+            result = {'message_id': len(self.server.sent_messages) + 1, 'date': int(time.time()), 'chat': CHAT, 'text': ''}
+            self.server.sent_messages.append(time.perf_counter())
+            self.server.message_sent.set()
+        else:
+            result = True
+
+        body = json.dumps({'ok': True, 'result': result}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def free_port():
+    """Свободный TCP порт на localhost"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_update(update_id):
+    """Обновление Telegram с командой /start"""
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': CHAT,
+            'from': USER,
+            'text': '/start',
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}]
+        }
+    }
+
+
+def post_update(port, update):
+    """Отправляет обновление на вебхук бота"""
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{port}/telegram",
+        data=json.dumps(update).encode('utf-8'),
+        headers={'Content-Type': 'application/json'}
+    )
+    urllib.request.urlopen(request, timeout=10).read()
+
+
+def wait_for_health(port, process, timeout):
+    """Ждет ответа /health, возвращает момент готовности"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Бот завершился с кодом {process.returncode}")
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1).read()
+            return time.perf_counter()
+        except (urllib.error.URLError, ConnectionError, OSError):
+            time.sleep(0.005)
+    raise TimeoutError("Бот не ответил на /health")
+
+
+def wait_for_message(api, timeout):
+    """Ждет отправки ботом сообщения, возвращает момент отправки"""
+    if not api.message_sent.wait(timeout):
+        raise TimeoutError("Бот не ответил на /start")
+    api.message_sent.clear()
+    return api.sent_messages[-1]
+
+
+def run_once(api, warm_up, timeout, show_output):
+    """Один запуск бота
+
+    Returns:
+        dict: Время (с) до /health и до первого ответа на /start от запуска,
+        время повторного ответа на /start
+    """
+    port = free_port()
+    env = dict(
+        os.environ,
+        TELEGRAM_BOT_TOKEN='100:benchmark',
+        TELEGRAM_API_URL=api.url,
+        PLATON_BOT_MODE='webhook',
+        PLATON_WEBHOOK_URL='',
+        RENDER_EXTERNAL_URL='',
+        PLATON_WARM_UP='1' if warm_up else '0',
+        PORT=str(port)
+    )
+    output = None if show_output else subprocess.DEVNULL
+
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, BOT_SCRIPT], env=env, stdout=output, stderr=output)
+    try:
+        ready = wait_for_health(port, process, timeout)
+        post_update(port, start_update(1))
+        first_response = wait_for_message(api, timeout)
+        post_update(port, start_update(2))
+        second_response = wait_for_message(api, timeout)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+    return {
+        'health': ready - started,
+        'first_response': first_response - started,
+        'second_response': second_response - first_response
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Замер времени запуска бота до первого ответа')
+    parser.add_argument('--runs', type=int, default=3, help='Количество запусков')
+    parser.add_argument('--no-warm-up', action='store_true', help='Без фонового прогрева модуля обработки')
+    parser.add_argument('--timeout', type=float, default=60, help='Предельное время ожидания, с')
+    parser.add_argument('--verbose', action='store_true', help='Показывать вывод бота')
+    args = parser.parse_args()
+
+    api = FakeBotApi()
+    threading.Thread(target=api.serve_forever, daemon=True).start()
+
+    results = []
+    try:
+        for run in range(1, args.runs + 1):
+            result = run_once(api, not args.no_warm_up, args.timeout, args.verbose)
+            results.append(result)
+            print(
+                f"Запуск {run}: /health через {result['health']:.3f} с, "
+                f"первый ответ через {result['first_response']:.3f} с, "
+                f"повторный ответ за {result['second_response']:.3f} с"
+            )
+    finally:
+        api.shutdown()
+
+    print()
+    print("Медиана:")
+    print(f"  до ответа /health: {statistics.median(r['health'] for r in results):.3f} с")
+    print(f"  до первого ответа на /start: {statistics.median(r['first_response'] for r in results):.3f} с")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
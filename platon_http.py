@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Минимальный HTTP сервер на asyncio для бота "Платон"
+Принимает обновления Telegram (вебхук) и отвечает на служебные запросы
+в том же цикле событий, что и бот, без отдельного потока
+"""
+
+import asyncio
+import contextlib
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+STATUS_TEXT = {
+    200: 'OK',
+    400: 'Bad Request',
+    403: 'Forbidden',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    413: 'Payload Too Large',
+    414: 'URI Too Long',
+    431: 'Request Header Fields Too Large',
+    500: 'Internal Server Error',
+}
+
+
+class HttpError(Exception):
+    """Некорректный запрос, на который сервер отвечает статусом status"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class HttpRequest:
+    """Разобранный HTTP запрос"""
+
+    __slots__ = ('method', 'path', 'version', 'headers', 'body')
+
+    def __init__(self, method, path, version, headers, body):
+        self.method = method
+        self.path = path
+        # Версия протокола из строки запроса, например 'HTTP/1.1'
+        self.version = version
+        # Имена заголовков в нижнем регистре
+        self.headers = headers
+        self.body = body
+
+    @property
+    def keep_alive(self):
+        """Оставить ли соединение открытым после ответа
+
+        В HTTP/1.1 соединение по умолчанию остается открытым, в HTTP/1.0 —
+        закрывается, если клиент не попросил keep-alive.
+        """
+        connection = self.headers.get('connection', '').lower()
+        if self.version == 'HTTP/1.0':
+            return 'keep-alive' in connection
+        return 'close' not in connection
+
+
+def text_response(text, status=200, content_type='text/plain; charset=utf-8'):
+    """Ответ обработчика: (статус, Content-Type, тело)"""
+    return status, content_type, text.encode('utf-8')
+
+
+class HttpServer:
+    """HTTP/1.1 сервер с таблицей маршрутов (метод, путь) -> обработчик
+
+    Обработчик — корутина, принимающая HttpRequest и возвращающая
+    (статус, Content-Type, тело в байтах), см. text_response.
+    Соединения поддерживаются открытыми (keep-alive), пока клиент
+    не закроет их или не будет молчать дольше idle_timeout секунд.
+    """
+
+    def __init__(self, max_body=10 * 1024 * 1024, idle_timeout=75):
+        self.max_body = max_body
+        self.idle_timeout = idle_timeout
+        self.routes = {}
+        self.server = None
+
+    def route(self, method, path, handler):
+        """Регистрирует обработчик запросов method к path"""
+        self.routes[(method, path)] = handler
+
+    async def start(self, host, port):
+        """Начинает принимать соединения"""
+        self.server = await asyncio.start_server(self._handle_connection, host, port)
+        return self.server
+
+    async def close(self):
+        """Перестает принимать соединения"""
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def _handle_connection(self, reader, writer):
+        """Обслуживает запросы одного соединения"""
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), self.idle_timeout)
+                except HttpError as e:
+                    await self._write_response(writer, *text_response(str(e), e.status), keep_alive=False)
+                    break
+                if request is None:
+                    break
+
+                response = await self._dispatch(request)
+                keep_alive = request.keep_alive
+                await self._write_response(writer, *response, keep_alive=keep_alive, head=request.method == 'HEAD')
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def _read_request(self, reader):
+        """Читает один запрос, None — соединение закрыто клиентом"""
+        request_line = await self._read_line(reader, 414, "Слишком длинная строка запроса")
+        if not request_line:
+            return None
+        parts = request_line.decode('latin-1').split()
+        if len(parts) != 3:
+            raise HttpError(400, "Некорректная строка запроса")
+        method, target, version = parts
+
+        headers = {}
+        while True:
+            line = await self._read_line(reader, 431, "Слишком длинный заголовок")
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get('content-length', '0') or 0)
+        except ValueError:
+            raise HttpError(400, "Некорректный Content-Length")
+        if length < 0:
+            raise HttpError(400, "Некорректный Content-Length")
+        if length > self.max_body:
+            raise HttpError(413, "Слишком большой запрос")
+        body = await reader.readexactly(length) if length else b''
+        return HttpRequest(method, target.split('?', 1)[0], version.upper(), headers, body)
+
+    @staticmethod
+    async def _read_line(reader, status, message):
+        """Читает строку запроса или заголовка; строка длиннее буфера потока — HttpError(status)"""
+        try:
+            return await reader.readline()
+        except ValueError:
+            # StreamReader.readline превращает LimitOverrunError в ValueError
+            raise HttpError(status, message)
+
+    async def _dispatch(self, request):
+        """Вызывает обработчик маршрута (HEAD обслуживается обработчиком GET)"""
+        method = 'GET' if request.method == 'HEAD' else request.method
+        handler = self.routes.get((method, request.path))
+        if handler is None:
+            if any(path == request.path for _, path in self.routes):
+                return text_response("Method Not Allowed", 405)
+            return text_response("Not Found", 404)
+        try:
+            return await handler(request)
+        except Exception as e:
+            logger.error(f"Ошибка при обработке запроса {request.method} {request.path}: {e}")
+            return text_response("Internal Server Error", 500)
+
+    async def _write_response(self, writer, status, content_type, body, keep_alive=True, head=False):
+        """Отправляет ответ"""
+        head_lines = [
+            f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}",
+            f"Content-Type: {content_type}",
+            f"Content-Length: {len(body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        writer.write(('\r\n'.join(head_lines) + '\r\n\r\n').encode('latin-1'))
+        if not head:
+            writer.write(body)
+        await writer.drain()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Метрики бота "Платон" в текстовом формате Prometheus
+Гистограммы длительностей, счетчики и показатели, вычисляемые при запросе
+"""
+
+import math
+import multiprocessing
+import resource
+import time
+from contextlib import contextmanager
+
+
+# Границы корзин гистограмм длительности, секунды
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _escape(value):
+    """Экранирует значение метки"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    """Число в формате Prometheus"""
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Гистограмма с одной меткой (например, этап обработки)"""
+
+    def __init__(self, name, help_text, label, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(buckets) + (math.inf,)
+        # значение метки -> [счетчики корзин, сумма, количество]
+        self.series = {}
+
+    def observe(self, label_value, value):
+        """Учитывает одно наблюдение"""
+        series = self.series.get(label_value)
+        if series is None:
+            series = self.series[label_value] = [[0] * len(self.buckets), 0.0, 0]
+        counts = series[0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        series[1] += value
+        series[2] += 1
+
+    @contextmanager
+    def time(self, label_value):
+        """Замеряет длительность блока with"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(label_value, time.perf_counter() - start)
+
+    def render(self):
+        """Строки гистограммы в формате Prometheus"""
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_value, (counts, total, count) in sorted(self.series.items()):
+            label = f'{self.label}="{_escape(label_value)}"'
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{label},le="{_format_value(bound)}"}} {bucket_count}')
+            lines.append(f"{self.name}_sum{{{label}}} {_format_value(total)}")
+            lines.append(f"{self.name}_count{{{label}}} {count}")
+        return lines
+
+
+class Counter:
+    """Монотонно растущий счетчик"""
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.value = 0
+
+    def inc(self, amount=1):
+        """Увеличивает счетчик"""
+        self.value += amount
+
+    def render(self):
+        """Строки счетчика в формате Prometheus"""
+        return [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} counter",
+            f"{self.name} {_format_value(self.value)}"
+        ]
+
+
+class Gauge:
+    """Показатель, значение которого вычисляется функцией при каждом запросе"""
+
+    def __init__(self, name, help_text, function):
+        self.name = name
+        self.help_text = help_text
+        self.function = function
+
+    def render(self):
+        """Строки показателя в формате Prometheus"""
+        return [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} gauge",
+            f"{self.name} {_format_value(self.function())}"
+        ]
+
+
+class MetricsRegistry:
+    """Набор метрик, отдаваемых на /metrics"""
+
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self):
+        self.metrics = []
+
+    def histogram(self, name, help_text, label, buckets=DEFAULT_BUCKETS):
+        """Создает и регистрирует гистограмму"""
+        return self._add(Histogram(name, help_text, label, buckets))
+
+    def counter(self, name, help_text):
+        """Создает и регистрирует счетчик"""
+        return self._add(Counter(name, help_text))
+
+    def gauge(self, name, help_text, function):
+        """Создает и регистрирует показатель"""
+        return self._add(Gauge(name, help_text, function))
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Текст для ответа на /metrics"""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+def resident_memory_bytes(pid='self'):
+    """Текущий RSS процесса в байтах (/proc), для своего процесса без /proc — пиковый"""
+    try:
+        with open(f'/proc/{pid}/status', 'rb') as file:
+            for line in file:
+                if line.startswith(b'VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if pid == 'self':
+        # На Linux ru_maxrss в килобайтах
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return 0
+
+
+def children_resident_memory_bytes():
+    """Суммарный RSS дочерних процессов multiprocessing (пулы обработки)"""
+    return sum(resident_memory_bytes(child.pid) for child in multiprocessing.active_children())
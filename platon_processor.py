@@ -5,148 +5,530 @@
 Обрабатывает CSV файлы и создает Excel отчет по начислениям
 """
 
-import csv
 import pandas as pd
-from datetime import datetime
+import io
 import os
 import sys
-from collections import defaultdict
 import argparse
 import glob
+import heapq
+import pickle
+import tempfile
+import time
 import traceback
+from concurrent.futures import ProcessPoolExecutor
+from openpyxl import Workbook
+from typing import Iterator
+from platon_records import (
+    COL_TIMESTAMP, COL_OPERATION_ID, COL_OPERATION_TYPE, COL_VEHICLE,
+    COL_DISTANCE, COL_ROAD, COL_AMOUNT, COL_DEVICE, TIMESTAMP_FORMAT,
+    PlatonOperation, read_operations
+)
+from platon_store import PlatonStore
+
+
+NUMERIC_COLUMNS = [COL_DISTANCE, COL_AMOUNT]
+# Предел строк на листе Excel: длинные листы продолжаются на следующих
+EXCEL_MAX_ROWS = 1048576
+CELL_COLUMNS = ['vehicle', 'road', 'operation_type', 'day', 'count', 'kopecks', 'meters', 'charged']
+CATEGORICAL_COLUMNS = [COL_OPERATION_TYPE, COL_VEHICLE, COL_ROAD, COL_DEVICE]
+# Сколько лидеров по сумме начислений хранится в summary['rankings'] для каждого измерения
+RANKING_SIZE = 10
+
+
+class PlatonAggregator:
+    """Накапливает итоги по операциям, не храня сами записи
+
+    Все группировки строятся из одной таблицы ячеек
+    (ТС, дорога, тип операции, день) -> [количество, копейки, метры, начислений],
+    которая заполняется за один проход по данным. Суммы в ячейках целые,
+    поэтому итоги не зависят от порядка сложения.
+    """
+
+    def __init__(self):
+        self.cells = {}
+
+    def add(self, op):
+        """Учитывает одну операцию"""
+        day = op.timestamp.date() if op.timestamp is not None else None
+        self._add_cell(
+            (op.vehicle, op.road, op.operation_type, day),
+            1, op.kopecks, op.meters, 1 if op.kopecks != 0 else 0
+        )
+
+    def add_frame(self, frame):
+        """Учитывает колонки, загруженные PlatonProcessor.read_csv_columns"""
+        if frame.empty:
+            return
+        kopecks = (frame[COL_AMOUNT] * 100).round().astype('int64')
+        values = pd.DataFrame({
+            'kopecks': kopecks,
+            'meters': (frame[COL_DISTANCE] * 1000).round().astype('int64'),
+            'charged': kopecks != 0
+        })
+        keys = [
+            frame[COL_VEHICLE],
+            frame[COL_ROAD],
+            frame[COL_OPERATION_TYPE],
+            frame[COL_TIMESTAMP].dt.normalize()
+        ]
+        cube = values.groupby(keys, observed=True, sort=False, dropna=False).agg(
+            count=('kopecks', 'size'),
+            kopecks=('kopecks', 'sum'),
+            meters=('meters', 'sum'),
+            charged=('charged', 'sum')
+        )
+        for (vehicle, road, operation_type, day), count, kopecks_sum, meters_sum, charged in cube.itertuples():
+            self._add_cell(
+                (vehicle, road, operation_type, None if pd.isna(day) else day.date()),
+                int(count), int(kopecks_sum), int(meters_sum), int(charged)
+            )
+
+    def merge(self, other):
+        """Добавляет итоги другого агрегатора (например, посчитанного в другом процессе)"""
+        for key, (count, kopecks, meters, charged) in other.cells.items():
+            self._add_cell(key, count, kopecks, meters, charged)
+
+    def _add_cell(self, key, count, kopecks, meters, charged):
+        """Добавляет итоги к ячейке"""
+        cell = self.cells.get(key)
+        if cell is None:
+            self.cells[key] = [count, kopecks, meters, charged]
+        else:
+            cell[0] += count
+            cell[1] += kopecks
+            cell[2] += meters
+            cell[3] += charged
+
+    def summary(self):
+        """Возвращает сводку в формате PlatonProcessor.summary"""
+        by_vehicle = {}
+        by_road = {}
+        by_date = {}
+        by_operation_type = {}
+        total_records = 0
+        total_amount = 0.0
+        total_distance = 0.0
+
+        for (vehicle, road, operation_type, day), (count, kopecks, meters, charged) in self.cells.items():
+            amount = kopecks / 100
+            distance = meters / 1000
+            total_records += count
+            total_amount += amount
+            total_distance += distance
+            self._add_to_group(by_vehicle, vehicle, count, amount, distance)
+            self._add_to_group(by_road, road, count, amount, distance)
+            self._add_to_group(by_operation_type, operation_type, count, amount, distance)
+            if day is not None:
+                self._add_to_group(by_date, day.isoformat(), count, amount, distance)
+
+        return {
+            'total_records': total_records,
+            'total_amount': total_amount,
+            'total_distance': total_distance,
+            'by_vehicle': by_vehicle,
+            'by_road': by_road,
+            'by_date': by_date,
+            'by_operation_type': by_operation_type,
+            'daily_matrix': self.daily_matrix(),
+            'vehicles': list(by_vehicle.keys()),
+            'roads': list(by_road.keys()),
+            'operation_types': list(by_operation_type.keys()),
+            # Лидеры по сумме начислений: новое измерение — еще одна группа здесь
+            'rankings': {
+                'vehicles': top_by_amount(by_vehicle),
+                'roads': top_by_amount(by_road),
+                'operation_types': top_by_amount(by_operation_type),
+                'dates': top_by_amount(by_date)
+            }
+        }
+
+    def cells_frame(self):
+        """Возвращает ячейки агрегатора таблицей, день — колонка datetime64"""
+        frame = pd.DataFrame(
+            [key + tuple(values) for key, values in self.cells.items()],
+            columns=CELL_COLUMNS
+        )
+        frame['day'] = pd.to_datetime(frame['day'])
+        return frame
+
+    def daily_matrix(self):
+        """Матрица ТС × день (сумма начислений в рублях) сводной таблицей по ячейкам
+
+        Строки — ГРЗ, столбцы — дни по возрастанию, нет начислений — 0.
+        """
+        frame = self.cells_frame()
+        frame = frame[(frame['vehicle'] != '') & (frame['charged'] > 0) & frame['day'].notna()]
+        if frame.empty:
+            return pd.DataFrame(dtype='float64')
+        matrix = frame.pivot_table(
+            index='vehicle', columns='day', values='kopecks', aggfunc='sum', fill_value=0
+        )
+        return matrix / 100
+
+    @staticmethod
+    def _add_to_group(groups, key, count, amount, distance):
+        """Обновляет количество, сумму и расстояние для группы"""
+        totals = groups.get(key)
+        if totals is None:
+            totals = groups[key] = {'count': 0, 'amount': 0.0, 'distance': 0.0}
+        totals['count'] += count
+        totals['amount'] += amount
+        totals['distance'] += distance
 
 
 class PlatonProcessor:
     """Класс для обработки данных системы Платон"""
     
-    def __init__(self):
-        self.data = []
+    def __init__(self, streaming=False, store=None):
+        # В потоковом режиме строки не сохраняются: операции сразу
+        # попадают в агрегатор, лист "Детальные данные" не создается
+        self.streaming = streaming
+        # Постоянное хранилище операций (PlatonStore): новые операции
+        # дописываются в него, а отчет строится по его итогам за месяцы,
+        # затронутые загруженными выписками
+        self.store = store
+        self.store_months = set()
+        # Типизированные колонки загруженных выписок (по DataFrame на файл)
+        self.frames = []
         self.summary = {}
+        self.aggregator = PlatonAggregator()
+        self.records_read = 0
+        # Индекс уже загруженных операций: пересекающиеся выписки
+        # не должны учитываться дважды
+        self.seen_operation_ids = set()
+        self.duplicates_skipped = 0
+        # Операции, сохраненные в хранилище при прошлых загрузках
+        # (в отчет входят, повторами не считаются)
+        self.already_stored = 0
+        # Длительности этапов [(этап, секунды), ...] и число прочитанных
+        # файлов: по ним бот строит метрики, в том числе для частей,
+        # прочитанных в рабочих процессах
+        self.phase_timings = []
+        self.files_read = 0
         # Желаемый порядок машин по трём цифрам после первой буквы ГРЗ
         self.desired_vehicle_codes_order = [
             '646','378','093','149','210','048','497','583','128','203','758','453','436','756','750','879','869','370','374','258','089','915','701','708'
         ]
         
     def read_csv_file(self, file_path):
-        """Читает CSV файл с данными системы Платон"""
-        print(f"Читаю файл: {file_path}")
+        """Читает CSV файл с данными системы Платон
+
+        Args:
+            file_path: Путь к файлу или содержимое выписки в байтах
+        """
+        if self.store is not None:
+            return self.store_csv_file(file_path)
+        if self.streaming:
+            return self.stream_csv_file(file_path)
+
+        print(f"Читаю файл: {_source_name(file_path)}")
         
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                # Определяем разделитель
-                sample = file.read(1024)
-                file.seek(0)
-                
-                if ';' in sample:
-                    delimiter = ';'
-                else:
-                    delimiter = ','
-                
-                reader = csv.DictReader(file, delimiter=delimiter)
-                
-                for row in reader:
-                    # Очищаем данные от лишних пробелов
-                    cleaned_row = {key.strip(): value.strip() for key, value in row.items()}
-                    self.data.append(cleaned_row)
+            started = time.perf_counter()
+            frame = self.read_csv_columns(file_path)
+            started = self._record_phase('parse', started)
+            total = len(frame)
+            frame = self._drop_seen_operations(frame)
+            started = self._record_phase('dedup', started)
+            self.aggregator.add_frame(frame)
+            self._record_phase('aggregate', started)
+            self.frames.append(frame)
+            self.records_read += len(frame)
+            self.files_read += 1
                     
-            print(f"Прочитано {len(self.data)} записей")
+            self._print_read_stats(len(frame), total - len(frame))
             return True
             
         except Exception as e:
-            print(f"Ошибка при чтении файла {file_path}: {e}")
+            print(f"Ошибка при чтении файла {_source_name(file_path)}: {e}")
             return False
+
+    def read_csv_files(self, file_paths, workers=1):
+        """Читает несколько CSV файлов, разбирая их параллельно в пуле процессов
+
+        Каждый файл читается отдельным PlatonProcessor в рабочем процессе,
+        результаты объединяются здесь строго в порядке file_paths, поэтому
+        повторяющиеся операции отбрасываются так же, как при чтении по одному.
+        С хранилищем файлы читаются последовательно (запись в SQLite идет
+        из одного процесса).
+
+        Returns:
+            list: Результат чтения (True/False) для каждого файла
+        """
+        if workers <= 1 or len(file_paths) < 2 or self.store is not None:
+            return [self.read_csv_file(file_path) for file_path in file_paths]
+
+        with ProcessPoolExecutor(max_workers=min(workers, len(file_paths))) as pool:
+            parts = pool.map(read_statement_part, file_paths, [self.streaming] * len(file_paths))
+            return [self.merge_part(file_path, part) for file_path, part in zip(file_paths, parts)]
+
+    def merge_part(self, file_path, part):
+        """Добавляет результат read_statement_part для файла file_path
+
+        Части нужно добавлять в порядке загрузки файлов: при пересечении
+        выписок повторами считаются операции более поздней.
+        """
+        if part is None:
+            return False
+
+        started = time.perf_counter()
+        self.phase_timings.extend(part.phase_timings)
+        if self.seen_operation_ids.isdisjoint(part.seen_operation_ids):
+            # Пересечений с уже загруженными выписками нет: берем готовые итоги
+            self.aggregator.merge(part.aggregator)
+            self.frames.extend(part.frames)
+            self.seen_operation_ids.update(part.seen_operation_ids)
+            self.records_read += part.records_read
+            self.files_read += part.files_read
+            self._record_phase('merge', started)
+            return True
+
+        # Выписка пересекается с предыдущими: повторно учитываем только новые операции
+        print(f"Файл {_source_name(file_path)} пересекается с загруженными ранее, убираю повторы")
+        if self.streaming:
+            return self.stream_csv_file(file_path)
+        for frame in part.frames:
+            total = len(frame)
+            frame = self._drop_seen_operations(frame)
+            self.aggregator.add_frame(frame)
+            self.frames.append(frame)
+            self.records_read += len(frame)
+            self._print_read_stats(len(frame), total - len(frame))
+        self.files_read += part.files_read
+        self._record_phase('merge', started)
+        return True
+
+    def read_csv_columns(self, file_path):
+        """Загружает выписку в DataFrame с типизированными колонками"""
+        delimiter = self._detect_delimiter(file_path)
+        # Файл на диске отображается в память, байты читаются из буфера
+        in_memory = isinstance(file_path, (bytes, bytearray))
+        # utf-8-sig убирает BOM из заголовка первой колонки
+        frame = pd.read_csv(
+            io.BytesIO(file_path) if in_memory else file_path, sep=delimiter, encoding='utf-8-sig',
+            dtype=str, keep_default_na=False, memory_map=not in_memory
+        )
+        frame.columns = [name.strip() for name in frame.columns]
+        for column in frame.columns:
+            frame[column] = frame[column].str.strip()
+
+        for column in [COL_TIMESTAMP, COL_OPERATION_ID] + NUMERIC_COLUMNS + CATEGORICAL_COLUMNS:
+            if column not in frame.columns:
+                frame[column] = ''
+
+        # Десятичная запятая заменяется сразу во всей колонке
+        for column in NUMERIC_COLUMNS:
+            frame[column] = pd.to_numeric(
+                frame[column].str.replace(',', '.', regex=False), errors='coerce'
+            ).fillna(0.0)
+
+        frame[COL_TIMESTAMP] = parse_timestamps(frame[COL_TIMESTAMP])
+        frame[COL_OPERATION_ID] = pd.to_numeric(frame[COL_OPERATION_ID], errors='coerce').fillna(0).astype('int64')
+
+        for column in CATEGORICAL_COLUMNS:
+            frame[column] = frame[column].astype('category')
+
+        return frame
+
+    def _drop_seen_operations(self, frame):
+        """Убирает операции, номера которых встречались в ранее загруженных выписках"""
+        ids = frame[COL_OPERATION_ID]
+        # Строки без номера операции не с чем сравнивать, их оставляем
+        has_id = ids != 0
+        duplicate = has_id & ids.isin(self.seen_operation_ids)
+        # Внутри одной выписки номер может повторяться (зачисление и списание
+        # по одной операции), поэтому индекс пополняется после всего файла
+        self.seen_operation_ids.update(ids[has_id & ~duplicate])
+        skipped = int(duplicate.sum())
+        if not skipped:
+            return frame
+        self.duplicates_skipped += skipped
+        return frame[~duplicate].reset_index(drop=True)
+
+    def _record_phase(self, phase, started):
+        """Запоминает длительность этапа, начатого в started (time.perf_counter)
+
+        Returns:
+            float: Время окончания этапа, начало следующего
+        """
+        finished = time.perf_counter()
+        self.phase_timings.append((phase, finished - started))
+        return finished
+
+    def _print_read_stats(self, count, skipped):
+        """Выводит количество прочитанных и пропущенных записей"""
+        if skipped:
+            print(f"Прочитано {count} записей, пропущено повторяющихся операций: {skipped}")
+        else:
+            print(f"Прочитано {count} записей")
+
+    def _detect_delimiter(self, file_path):
+        """Определяет разделитель CSV по первым байтам файла"""
+        if isinstance(file_path, (bytes, bytearray)):
+            sample = bytes(file_path[:1024]).decode('utf-8-sig', errors='ignore')
+        else:
+            with open(file_path, 'r', encoding='utf-8-sig') as file:
+                sample = file.read(1024)
+        return ';' if ';' in sample else ','
+
+    def stream_csv_file(self, file_path):
+        """Читает CSV файл потоково, передавая операции сразу в агрегатор"""
+        print(f"Читаю файл (потоково): {_source_name(file_path)}")
+
+        try:
+            started = time.perf_counter()
+            count = 0
+            skipped = 0
+            file_operation_ids = set()
+            for op in self.iter_operations(file_path):
+                if op.operation_id:
+                    if op.operation_id in self.seen_operation_ids:
+                        skipped += 1
+                        continue
+                    file_operation_ids.add(op.operation_id)
+                self.aggregator.add(op)
+                count += 1
+            # Как и в _drop_seen_operations, индекс пополняется после всего файла
+            self.seen_operation_ids.update(file_operation_ids)
+            self.duplicates_skipped += skipped
+            self.records_read += count
+            self.files_read += 1
+            self._record_phase('stream', started)
+            self._print_read_stats(count, skipped)
+            return True
+
+        except Exception as e:
+            print(f"Ошибка при чтении файла {_source_name(file_path)}: {e}")
+            return False
+
+    def store_csv_file(self, file_path):
+        """Дописывает в хранилище операции выписки, которых там еще нет"""
+        print(f"Читаю файл в хранилище: {_source_name(file_path)}")
+
+        try:
+            started = time.perf_counter()
+            if self.streaming:
+                rows = (self._store_row(op) for op in self.iter_operations(file_path))
+            else:
+                rows = self._store_rows(self.read_csv_columns(file_path))
+            tracker = StoreBatchTracker(self.seen_operation_ids, self.store_months)
+            added, skipped = self.store.add_rows(tracker.track(rows))
+            # Хранилище пропускает и повторы из предыдущих выписок этой
+            # загрузки, и операции, сохраненные при прошлых загрузках.
+            # Повторами считаются только первые, как и без хранилища
+            already_stored = skipped - tracker.duplicates
+            self.duplicates_skipped += tracker.duplicates
+            self.already_stored += already_stored
+            # В отчет попадают все операции выписки, в том числе сохраненные ранее
+            self.records_read += added + already_stored
+            self.files_read += 1
+            self._record_phase('store', started)
+            self._print_read_stats(added, tracker.duplicates)
+            if already_stored:
+                print(f"Уже были в хранилище: {already_stored}")
+            return True
+
+        except Exception as e:
+            print(f"Ошибка при чтении файла {_source_name(file_path)}: {e}")
+            return False
+
+    def _store_rows(self, frame):
+        """Преобразует колонки выписки в строки для PlatonStore.add_rows"""
+        timestamps = frame[COL_TIMESTAMP]
+        days = timestamps.dt.strftime('%Y-%m-%d').fillna('')
+        return zip(
+            days.str[:7].tolist(),
+            frame[COL_OPERATION_ID].tolist(),
+            timestamps.dt.strftime('%Y-%m-%d %H:%M:%S').fillna('').tolist(),
+            days.tolist(),
+            frame[COL_OPERATION_TYPE].astype(str).tolist(),
+            frame[COL_VEHICLE].astype(str).tolist(),
+            frame[COL_ROAD].astype(str).tolist(),
+            frame[COL_DEVICE].astype(str).tolist(),
+            (frame[COL_AMOUNT] * 100).round().astype('int64').tolist(),
+            (frame[COL_DISTANCE] * 1000).round().astype('int64').tolist()
+        )
+
+    def _store_row(self, op):
+        """Преобразует PlatonOperation в строку для PlatonStore.add_rows"""
+        timestamp = op.timestamp.strftime('%Y-%m-%d %H:%M:%S') if op.timestamp is not None else ''
+        day = timestamp[:10]
+        return (
+            day[:7], op.operation_id, timestamp, day,
+            op.operation_type, op.vehicle, op.road, op.device,
+            op.kopecks, op.meters
+        )
+
+    def iter_operations(self, file_path) -> Iterator[PlatonOperation]:
+        """Генератор типизированных операций из CSV файла или его байтов (по одной строке в памяти)"""
+        yield from read_operations(file_path)
     
     def process_data(self):
         """Обрабатывает данные и создает сводку"""
         print("Обрабатываю данные...")
+        started = time.perf_counter()
         
-        # Группируем данные по различным критериям
-        by_vehicle = defaultdict(list)
-        by_road = defaultdict(list)
-        by_date = defaultdict(list)
-        by_operation_type = defaultdict(list)
-        
-        total_amount = 0
-        total_distance = 0
-        
-        for record in self.data:
-            # Извлекаем основные данные
-            vehicle = record.get('ГРЗ ТС', '')
-            road = record.get('Наименование дороги', '')
-            operation_type = record.get('Тип операции', '')
-            distance = self._parse_float(record.get('Путь по фед. дорогам, км', '0'))
-            amount = self._parse_float(record.get('Списание с РЗ (руб.)', '0'))
-            date_str = record.get('Дата/время операции (мск)', '')
-            
-            # Группируем данные
-            by_vehicle[vehicle].append(record)
-            by_road[road].append(record)
-            by_operation_type[operation_type].append(record)
-            
-            # Парсим дату
-            try:
-                date_obj = datetime.strptime(date_str.split()[0], '%d.%m.%Y')
-                by_date[date_obj.strftime('%Y-%m-%d')].append(record)
-            except:
-                pass
-            
-            total_amount += amount
-            total_distance += distance
+        if self.store is not None:
+            # Итоги за затронутые месяцы (или за все, если файлы не читались)
+            # включают и операции, загруженные в хранилище ранее
+            self.aggregator = PlatonAggregator()
+            self.aggregator.cells = self.store.load_cells(self.store_months or None)
         
+        # Агрегаты уже накоплены при чтении файлов, здесь только сводка
         # Создаем сводку
-        self.summary = {
-            'total_records': len(self.data),
-            'total_amount': total_amount,
-            'total_distance': total_distance,
-            'by_vehicle': dict(by_vehicle),
-            'by_road': dict(by_road),
-            'by_date': dict(by_date),
-            'by_operation_type': dict(by_operation_type),
-            'vehicles': list(by_vehicle.keys()),
-            'roads': list(by_road.keys()),
-            'operation_types': list(by_operation_type.keys())
-        }
+        self.summary = self.aggregator.summary()
+        self.summary['duplicates_skipped'] = self.duplicates_skipped
+        self.summary['already_stored'] = self.already_stored
+        self._record_phase('summary', started)
         
-        print(f"Обработано {len(self.data)} записей")
-        print(f"Общая сумма: {total_amount:.2f} руб.")
-        print(f"Общее расстояние: {total_distance:.2f} км")
-        print(f"Транспортных средств: {len(by_vehicle)}")
-        print(f"Дорог: {len(by_road)}")
+        print(f"Обработано {self.summary['total_records']} записей")
+        print(f"Общая сумма: {self.summary['total_amount']:.2f} руб.")
+        print(f"Общее расстояние: {self.summary['total_distance']:.2f} км")
+        print(f"Транспортных средств: {len(self.summary['vehicles'])}")
+        print(f"Дорог: {len(self.summary['roads'])}")
+        if self.duplicates_skipped:
+            print(f"Пропущено повторяющихся операций: {self.duplicates_skipped}")
+        if self.already_stored:
+            print(f"Операций из хранилища, загруженных ранее: {self.already_stored}")
         
-    def _parse_float(self, value):
-        """Парсит строку в число с плавающей точкой"""
-        try:
-            # Заменяем запятую на точку для корректного парсинга
-            return float(value.replace(',', '.'))
-        except:
-            return 0.0
-    
     def create_excel_report(self, output_file):
-        """Создает Excel отчет по образцу"""
-        print(f"Создаю Excel отчет: {output_file}")
+        """Создает Excel отчет по образцу
+
+        Args:
+            output_file: Путь к файлу или двоичный буфер (например, io.BytesIO)
+        """
+        print(f"Создаю Excel отчет: {_output_name(output_file)}")
+        started = time.perf_counter()
         
         try:
-            # Создаем Excel writer
-            with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
-                # 0. Матрица начислений: ТС × дни
-                self._create_daily_vehicle_matrix_sheet(writer)
-                
-                # 1. Общая сводка
-                self._create_summary_sheet(writer)
-                
-                # 2. Данные по транспортным средствам
-                self._create_vehicles_sheet(writer)
-                
-                # 3. Данные по дорогам
-                self._create_roads_sheet(writer)
-                
-                # 4. Данные по датам
-                self._create_dates_sheet(writer)
-                
-                # 5. Детальные данные
-                self._create_details_sheet(writer)
-                
-            print(f"Excel отчет создан: {output_file}")
+            # Книга в режиме write-only: строки сбрасываются на диск по мере записи
+            workbook = Workbook(write_only=True)
+            
+            # 0. Матрица начислений: ТС × дни
+            self._create_daily_vehicle_matrix_sheet(workbook)
+            
+            # 1. Общая сводка
+            self._create_summary_sheet(workbook)
+            
+            # 2. Данные по транспортным средствам
+            self._create_vehicles_sheet(workbook)
+            
+            # 3. Данные по дорогам
+            self._create_roads_sheet(workbook)
+            
+            # 4. Данные по датам
+            self._create_dates_sheet(workbook)
+            
+            # 5. Детальные данные (в потоковом режиме и при работе
+            # с хранилищем строки не сохраняются)
+            if self.frames:
+                self._create_details_sheet(workbook)
+            
+            workbook.save(output_file)
+            
+            self._record_phase('excel', started)
+            print(f"Excel отчет создан: {_output_name(output_file)}")
             return True
             
         except Exception as e:
@@ -154,7 +536,7 @@ class PlatonProcessor:
             print(traceback.format_exc())
             return False
     
-    def _create_summary_sheet(self, writer):
+    def _create_summary_sheet(self, workbook):
         """Создает лист с общей сводкой"""
         summary_data = {
             'Показатель': [
@@ -163,7 +545,8 @@ class PlatonProcessor:
                 'Общее расстояние (км)',
                 'Количество транспортных средств',
                 'Количество дорог',
-                'Количество типов операций'
+                'Количество типов операций',
+                'Пропущено повторяющихся операций'
             ],
             'Значение': [
                 self.summary['total_records'],
@@ -171,21 +554,22 @@ class PlatonProcessor:
                 f"{self.summary['total_distance']:.2f}",
                 len(self.summary['vehicles']),
                 len(self.summary['roads']),
-                len(self.summary['operation_types'])
+                len(self.summary['operation_types']),
+                self.summary['duplicates_skipped']
             ]
         }
         
         df = pd.DataFrame(summary_data)
-        df.to_excel(writer, sheet_name='Общая сводка', index=False)
+        self._write_frame(workbook, 'Общая сводка', df)
     
-    def _create_vehicles_sheet(self, writer):
+    def _create_vehicles_sheet(self, workbook):
         """Создает лист с данными по транспортным средствам"""
         vehicle_data = []
         
-        for vehicle, records in self.summary['by_vehicle'].items():
-            total_amount = sum(self._parse_float(r.get('Списание с РЗ (руб.)', '0')) for r in records)
-            total_distance = sum(self._parse_float(r.get('Путь по фед. дорогам, км', '0')) for r in records)
-            trips_count = len(records)
+        for vehicle, totals in self.summary['by_vehicle'].items():
+            total_amount = totals['amount']
+            total_distance = totals['distance']
+            trips_count = totals['count']
             avg_amount = (total_amount / trips_count) if trips_count > 0 else 0.0
             
             vehicle_data.append({
@@ -210,16 +594,16 @@ class PlatonProcessor:
         df['__code'] = df['ГРЗ ТС'].apply(extract_code)
         df['__ord'] = df['__code'].apply(lambda c: order_index.get(c, 10**6))
         df = df.sort_values(['__ord','ГРЗ ТС']).drop(columns=['__code','__ord'])
-        df.to_excel(writer, sheet_name='По транспортным средствам', index=False)
+        self._write_frame(workbook, 'По транспортным средствам', df)
     
-    def _create_roads_sheet(self, writer):
+    def _create_roads_sheet(self, workbook):
         """Создает лист с данными по дорогам"""
         road_data = []
         
-        for road, records in self.summary['by_road'].items():
-            total_amount = sum(self._parse_float(r.get('Списание с РЗ (руб.)', '0')) for r in records)
-            total_distance = sum(self._parse_float(r.get('Путь по фед. дорогам, км', '0')) for r in records)
-            trips_count = len(records)
+        for road, totals in self.summary['by_road'].items():
+            total_amount = totals['amount']
+            total_distance = totals['distance']
+            trips_count = totals['count']
             
             road_data.append({
                 'Наименование дороги': road,
@@ -231,16 +615,16 @@ class PlatonProcessor:
         
         df = pd.DataFrame(road_data)
         df = df.sort_values('Общая сумма (руб.)', ascending=False)
-        df.to_excel(writer, sheet_name='По дорогам', index=False)
+        self._write_frame(workbook, 'По дорогам', df)
     
-    def _create_dates_sheet(self, writer):
+    def _create_dates_sheet(self, workbook):
         """Создает лист с данными по датам"""
         date_data = []
         
-        for date, records in self.summary['by_date'].items():
-            total_amount = sum(self._parse_float(r.get('Списание с РЗ (руб.)', '0')) for r in records)
-            total_distance = sum(self._parse_float(r.get('Путь по фед. дорогам, км', '0')) for r in records)
-            trips_count = len(records)
+        for date, totals in self.summary['by_date'].items():
+            total_amount = totals['amount']
+            total_distance = totals['distance']
+            trips_count = totals['count']
             
             date_data.append({
                 'Дата': date,
@@ -256,52 +640,23 @@ class PlatonProcessor:
             if 'Дата' in df.columns:
                 df = df.sort_values('Дата')
         
-        df.to_excel(writer, sheet_name='По датам', index=False)
+        self._write_frame(workbook, 'По датам', df)
     
-    def _create_daily_vehicle_matrix_sheet(self, writer):
+    def _create_daily_vehicle_matrix_sheet(self, workbook):
         """Создает лист-матрицу: строки — ТС, столбцы — дни (дд.мм), значения — сумма начислений за день"""
-        # Суммируем по (ТС, день)
-        vehicle_to_date_sum = defaultdict(lambda: defaultdict(float))
-        all_dates = set()
+        # Сводная таблица ТС × день уже построена агрегатором
+        matrix = self.summary['daily_matrix']
         
         print("Создаю матрицу начислений по дням...")
         
-        for record in self.data:
-            vehicle = record.get('ГРЗ ТС', '')
-            if not vehicle:
-                continue
-            # Обрабатываем BOM в названии колонки
-            date_str = record.get('Дата/время операции (мск)', '') or record.get('\ufeffДата/время операции (мск)', '')
-            amount = self._parse_float(record.get('Списание с РЗ (руб.)', '0'))
-            
-            if amount == 0:
-                continue
-                
-            try:
-                # Парсим дату в формате "01.10.2025 00:06:52"
-                if not date_str or not date_str.strip():
-                    continue
-                date_part = date_str.split()[0]  # "01.10.2025"
-                day_key = datetime.strptime(date_part, '%d.%m.%Y').strftime('%d.%m')
-            except Exception as e:
-                # Убираем отладочный вывод для пустых дат
-                if date_str and date_str.strip():
-                    print(f"Ошибка парсинга даты '{date_str}': {e}")
-                continue
-            
-            vehicle_to_date_sum[vehicle][day_key] += amount
-            all_dates.add(day_key)
-        
-        print(f"Найдено уникальных дат: {len(all_dates)}")
-        print(f"Найдено уникальных ТС: {len(vehicle_to_date_sum)}")
+        print(f"Найдено уникальных дат: {len(matrix.columns)}")
+        print(f"Найдено уникальных ТС: {len(matrix.index)}")
         
-        if not all_dates:
+        if matrix.empty:
             print("Нет данных для создания матрицы")
             df = pd.DataFrame(columns=['ГРЗ ТС'])
         else:
-            # Отсортированные оси: даты по месяцу/дню, ТС по заданному порядку
-            sorted_dates = sorted(all_dates, key=lambda d: (int(d.split('.')[1]), int(d.split('.')[0])))  # по месяцу, затем дню
-
+            # Даты уже отсортированы сводной таблицей, ТС — по заданному порядку
             def extract_code_from_grz(grz: str) -> str:
                 import re
                 m = re.match(r'^[A-Za-zА-Яа-я](\d{3})', grz or '')
@@ -309,31 +664,24 @@ class PlatonProcessor:
 
             order_index = {code: i for i, code in enumerate(self.desired_vehicle_codes_order)}
             sorted_vehicles = sorted(
-                vehicle_to_date_sum.keys(),
+                matrix.index,
                 key=lambda v: (order_index.get(extract_code_from_grz(v), 10**6), v)
             )
             
-            print(f"Создаю таблицу {len(sorted_vehicles)}x{len(sorted_dates)}")
-            
-            # Формируем таблицу
-            table_rows = []
-            for vehicle in sorted_vehicles:
-                row = {'ГРЗ ТС': vehicle}
-                for d in sorted_dates:
-                    value = round(vehicle_to_date_sum[vehicle].get(d, 0.0), 2)
-                    row[d] = value if value != 0 else ''
-                table_rows.append(row)
+            print(f"Создаю таблицу {len(sorted_vehicles)}x{len(matrix.columns)}")
             
-            df = pd.DataFrame(table_rows, columns=['ГРЗ ТС'] + list(sorted_dates))
+            # Формируем таблицу: нулевые ячейки остаются пустыми
+            values = matrix.reindex(sorted_vehicles).round(2)
+            df = values.astype(object).where(values != 0, '')
+            df.columns = matrix.columns.strftime('%d.%m')
+            df.insert(0, 'ГРЗ ТС', values.index)
+            df = df.reset_index(drop=True)
         
-        df.to_excel(writer, sheet_name='Начисления по дням', index=False)
+        self._write_frame(workbook, 'Начисления по дням', df)
         print("Матрица начислений по дням создана")
 
-    def _create_details_sheet(self, writer):
-        """Создает лист с детальными данными"""
-        # Преобразуем данные в DataFrame
-        df = pd.DataFrame(self.data)
-        
+    def _create_details_sheet(self, workbook):
+        """Создает лист с детальными данными (строки пишутся потоково по выпискам)"""
         # Переименовываем колонки для лучшей читаемости
         column_mapping = {
             'Дата/время операции (мск)': 'Дата операции',
@@ -348,13 +696,211 @@ class PlatonProcessor:
             'Дата и время окончания движения (мск)': 'Окончание движения'
         }
         
-        df = df.rename(columns=column_mapping)
-        
         # Удаляем колонку "Зачисление на РЗ" если она пустая
-        if 'Зачисление на РЗ (руб.)' in df.columns:
-            df = df.drop(columns=['Зачисление на РЗ (руб.)'])
+        columns = [column for column in self.frames[0].columns if column != 'Зачисление на РЗ (руб.)']
+        header = [column_mapping.get(column, column) for column in columns]
         
-        df.to_excel(writer, sheet_name='Детальные данные', index=False)
+        rows = (
+            row
+            for frame in self.frames
+            for row in frame.reindex(columns=columns).itertuples(index=False, name=None)
+        )
+        self._write_rows(workbook, 'Детальные данные', header, rows)
+
+    def _write_frame(self, workbook, sheet_name, df):
+        """Записывает DataFrame на лист книги (заголовок и строки, без индекса)"""
+        self._write_rows(workbook, sheet_name, list(df.columns), df.itertuples(index=False, name=None))
+
+    def _write_rows(self, workbook, sheet_name, header, rows):
+        """Пишет строки на лист, продолжая на листах "<имя> (2)", ... при достижении предела Excel"""
+        sheet = workbook.create_sheet(sheet_name)
+        sheet.append(header)
+        sheet_rows = 1
+        part = 1
+        for row in rows:
+            if sheet_rows == EXCEL_MAX_ROWS:
+                part += 1
+                sheet = workbook.create_sheet(f"{sheet_name} ({part})")
+                sheet.append(header)
+                sheet_rows = 1
+            sheet.append([_excel_value(value) for value in row])
+            sheet_rows += 1
+
+
+class StoreBatchTracker:
+    """Следит за строками выписки, передаваемыми в хранилище
+
+    Запоминает месяцы операций и считает повторы операций из предыдущих
+    выписок той же загрузки (номера из seen_operation_ids). Номера
+    выписки добавляются в seen_operation_ids после всего файла.
+    """
+
+    def __init__(self, seen_operation_ids, months):
+        self.seen_operation_ids = seen_operation_ids
+        self.months = months
+        self.duplicates = 0
+
+    def track(self, rows):
+        """Пропускает строки PlatonStore.add_rows через себя"""
+        file_operation_ids = set()
+        for row in rows:
+            self.months.add(row[0])
+            operation_id = row[1]
+            if operation_id:
+                if operation_id in self.seen_operation_ids:
+                    self.duplicates += 1
+                else:
+                    file_operation_ids.add(operation_id)
+            yield row
+        self.seen_operation_ids.update(file_operation_ids)
+
+
+def top_by_amount(groups, size=RANKING_SIZE):
+    """Первые size групп по убыванию суммы начислений: [(ключ, сумма), ...]
+
+    Выбор через кучу размера size, без сортировки всех групп.
+    При равных суммах сохраняется порядок групп.
+    """
+    leaders = heapq.nlargest(size, groups.items(), key=lambda item: item[1]['amount'])
+    return [(key, totals['amount']) for key, totals in leaders]
+
+
+def parse_timestamps(values):
+    """Колонка дат/времени операций в datetime, как parse_timestamp для каждого значения
+
+    Значения без времени (или с некорректным временем) разбираются по
+    первому слову как дата 'дд.мм.гггг', некорректные даты становятся NaT.
+    """
+    timestamps = pd.to_datetime(values, format=TIMESTAMP_FORMAT, errors='coerce')
+    retry = timestamps.isna() & (values != '')
+    if retry.any():
+        dates = pd.to_datetime(values[retry].str.split().str[0], format='%d.%m.%Y', errors='coerce')
+        timestamps = timestamps.fillna(dates)
+    return timestamps
+
+
+def _excel_value(value):
+    """Приводит значение из DataFrame к типу, который принимает openpyxl"""
+    if value is None or isinstance(value, str):
+        return value
+    if pd.isna(value):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    return value
+
+
+def _source_name(file_path):
+    """Имя выписки для сообщений: путь к файлу или размер загруженных байтов"""
+    if isinstance(file_path, (bytes, bytearray)):
+        return f"<в памяти, {len(file_path)} байт>"
+    return file_path
+
+
+def _output_name(output_file):
+    """Имя отчета для сообщений: путь к файлу или пометка о буфере"""
+    if isinstance(output_file, (str, os.PathLike)):
+        return output_file
+    return "<в памяти>"
+
+
+def read_statement_part(file_path, streaming):
+    """Читает одну выписку отдельным процессором (обычно в рабочем процессе)
+
+    Returns:
+        PlatonProcessor: Прочитанная часть для PlatonProcessor.merge_part или None
+    """
+    part = PlatonProcessor(streaming=streaming)
+    if not part.read_csv_file(file_path):
+        return None
+    return part
+
+
+def spill_statement_part(file_path, streaming):
+    """Читает одну выписку (см. read_statement_part) и сохраняет часть во временный файл
+
+    Бот держит только путь к части, а сами DataFrame и итоги остаются
+    на диске до построения отчета в render_parts.
+
+    Returns:
+        str: Путь к сохраненной части или None, если выписку не удалось прочитать
+    """
+    part = read_statement_part(file_path, streaming)
+    if part is None:
+        return None
+    descriptor, part_path = tempfile.mkstemp(suffix='.part.pickle')
+    with os.fdopen(descriptor, 'wb') as file:
+        pickle.dump(part, file, pickle.HIGHEST_PROTOCOL)
+    return part_path
+
+
+def render_parts(statements, streaming=False):
+    """Объединяет сохраненные части выписок в порядке загрузки и создает отчет
+
+    Args:
+        statements: Список (выписка, путь к части из spill_statement_part или None);
+            выписки без части читаются заново
+        streaming: Потоковый режим, в котором сохранялись части
+
+    Returns:
+        tuple: См. render_report
+    """
+    processor = PlatonProcessor(streaming=streaming)
+    for file_path, part_path in statements:
+        if part_path is None or not os.path.exists(part_path):
+            processor.read_csv_file(file_path)
+            continue
+        with open(part_path, 'rb') as file:
+            part = pickle.load(file)
+        processor.merge_part(file_path, part)
+    return render_report(processor)
+
+
+def build_report(file_paths, streaming=False, store_path=None):
+    """Полный цикл обработки выписок: чтение, итоги и Excel отчет
+
+    Выполняется в отдельном процессе (см. telegram_bot.py), поэтому
+    принимает только пути и настройки, а возвращает сводку и готовый
+    файл отчета, а не процессор со всеми операциями.
+
+    Returns:
+        tuple: См. render_report
+    """
+    store = PlatonStore(store_path) if store_path else None
+    try:
+        processor = PlatonProcessor(streaming=streaming, store=store)
+        processor.read_csv_files(file_paths)
+        return render_report(processor)
+    finally:
+        if store is not None:
+            store.close()
+
+
+def render_report(processor):
+    """Считает сводку по уже прочитанным выпискам и создает Excel отчет в памяти
+
+    Returns:
+        tuple: (PlatonProcessor.summary, содержимое .xlsx в байтах) или None,
+        если данные не загружены. В сводку добавляется 'processing':
+        число файлов и строк и длительности этапов
+
+    Raises:
+        RuntimeError: если не удалось создать Excel отчет
+    """
+    if not processor.records_read:
+        return None
+
+    processor.process_data()
+    report = io.BytesIO()
+    if not processor.create_excel_report(report):
+        raise RuntimeError("Ошибка при создании Excel отчета")
+    # Статистика обработки для метрик бота
+    processor.summary['processing'] = {
+        'files': processor.files_read,
+        'rows': processor.records_read,
+        'phase_timings': processor.phase_timings
+    }
+    return processor.summary, report.getvalue()
 
 
 def main():
@@ -362,6 +908,11 @@ def main():
     parser = argparse.ArgumentParser(description='Обработка данных системы Платон')
     parser.add_argument('csv_files', nargs='*', help='Пути к CSV файлам для обработки')
     parser.add_argument('-o', '--output', default='отчет_платон.xlsx', help='Имя выходного Excel файла')
+    parser.add_argument('--streaming', action='store_true',
+                        help='Потоковый режим с постоянным расходом памяти (без листа "Детальные данные")')
+    parser.add_argument('--store', help='Файл SQLite-хранилища: дописывать только новые операции и строить отчет по нему')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='Количество процессов для параллельного чтения файлов')
     
     args = parser.parse_args()
     
@@ -370,34 +921,42 @@ def main():
     input_files = list(args.csv_files)
     if not input_files:
         input_files = glob.glob("*.csv")
-        if not input_files:
+        if not input_files and not args.store:
             print("Ошибка: CSV файлы не найдены. Укажите файлы или положите их в текущую папку.")
             return 1
-        print(f"CSV файлы не были переданы как аргументы. Найдены в папке: {input_files}")
+        if input_files:
+            print(f"CSV файлы не были переданы как аргументы. Найдены в папке: {input_files}")
+        else:
+            print("CSV файлы не найдены, отчет строится по всем месяцам хранилища")
 
     print(f"Входные файлы: {input_files}")
     print(f"Выходной файл: {args.output}")
     print()
     
     # Создаем процессор
-    processor = PlatonProcessor()
+    store = PlatonStore(args.store) if args.store else None
+    processor = PlatonProcessor(streaming=args.streaming, store=store)
     
-    # Обрабатываем каждый CSV файл
+    # Обрабатываем CSV файлы (параллельно, если их несколько)
+    existing_files = []
     for csv_file in input_files:
         if not os.path.exists(csv_file):
             print(f"Ошибка: файл {csv_file} не найден")
             continue
-            
-        if not processor.read_csv_file(csv_file):
+        existing_files.append(csv_file)
+    
+    for csv_file, ok in zip(existing_files, processor.read_csv_files(existing_files, workers=args.jobs)):
+        if not ok:
             print(f"Не удалось прочитать файл {csv_file}")
-            continue
     
-    if not processor.data:
+    if not processor.records_read and store is None:
         print("Ошибка: не удалось загрузить данные из файлов")
         return 1
     
     # Обрабатываем данные
     processor.process_data()
+    if store is not None:
+        store.close()
     
     # Создаем Excel отчет
     if processor.create_excel_report(args.output):
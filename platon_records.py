@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Компактное представление операций системы "Платон"
+Не зависит от pandas и используется как основной, так и упрощенной программой
+"""
+
+import codecs
+import csv
+import mmap
+import os
+import sys
+from datetime import datetime
+
+
+# Колонки выписки Платон
+COL_TIMESTAMP = 'Дата/время операции (мск)'
+COL_OPERATION_ID = 'Уникальный номер операции'
+COL_OPERATION_TYPE = 'Тип операции'
+COL_VEHICLE = 'ГРЗ ТС'
+COL_DISTANCE = 'Путь по фед. дорогам, км'
+COL_ROAD = 'Наименование дороги'
+COL_AMOUNT = 'Списание с РЗ (руб.)'
+COL_DEVICE = 'Номер БУ/МК'
+
+TIMESTAMP_FORMAT = '%d.%m.%Y %H:%M:%S'
+
+# Колонки, из которых собирается PlatonOperation, в порядке _operation_from_fields
+OPERATION_COLUMNS = (
+    COL_TIMESTAMP, COL_OPERATION_ID, COL_OPERATION_TYPE, COL_VEHICLE,
+    COL_ROAD, COL_DEVICE, COL_AMOUNT, COL_DISTANCE
+)
+
+
+class PlatonOperation:
+    """Операция из выписки Платон
+
+    Сумма хранится в копейках, расстояние в метрах, номер операции —
+    целым числом (0, если номера нет). Тип операции, ГРЗ, дорога и номер
+    БУ интернируются: повторяющиеся значения занимают память один раз.
+    """
+
+    __slots__ = (
+        'timestamp', 'operation_id', 'operation_type', 'vehicle',
+        'road', 'device', 'kopecks', 'meters'
+    )
+
+    def __init__(self, timestamp, operation_id, operation_type, vehicle, road, device, kopecks, meters):
+        self.timestamp = timestamp
+        self.operation_id = operation_id
+        self.operation_type = sys.intern(operation_type)
+        self.vehicle = sys.intern(vehicle)
+        self.road = sys.intern(road)
+        self.device = sys.intern(device)
+        self.kopecks = kopecks
+        self.meters = meters
+
+    @classmethod
+    def from_record(cls, record):
+        """Создает операцию из строки выписки (словарь колонка -> значение)"""
+        return cls(
+            timestamp=parse_timestamp(record.get(COL_TIMESTAMP, '')),
+            operation_id=parse_int(record.get(COL_OPERATION_ID, '')),
+            operation_type=record.get(COL_OPERATION_TYPE, ''),
+            vehicle=record.get(COL_VEHICLE, ''),
+            road=record.get(COL_ROAD, ''),
+            device=record.get(COL_DEVICE, ''),
+            kopecks=parse_scaled(record.get(COL_AMOUNT, '0'), 100),
+            meters=parse_scaled(record.get(COL_DISTANCE, '0'), 1000)
+        )
+
+    @property
+    def amount(self):
+        """Сумма списания в рублях"""
+        return self.kopecks / 100
+
+    @property
+    def distance(self):
+        """Путь по федеральным дорогам в километрах"""
+        return self.meters / 1000
+
+    def __repr__(self):
+        return (
+            f"PlatonOperation({self.timestamp!r}, {self.operation_id}, {self.vehicle!r}, "
+            f"{self.road!r}, {self.kopecks} коп., {self.meters} м)"
+        )
+
+
+def parse_scaled(value, scale):
+    """Парсит число с десятичной запятой в целое число мелких единиц (копеек, метров)"""
+    try:
+        return round(float(value.replace(',', '.')) * scale)
+    except (AttributeError, ValueError):
+        return 0
+
+
+def parse_int(value):
+    """Парсит целое число, 0 если значение пустое или некорректное"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def parse_timestamp(value):
+    """Парсит дату/время операции, None если дата некорректна"""
+    value = (value or '').strip()
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, TIMESTAMP_FORMAT)
+    except ValueError:
+        pass
+    try:
+        return datetime.strptime(value.split()[0], '%d.%m.%Y')
+    except ValueError:
+        return None
+
+
+def read_operations(source):
+    """Генератор операций из CSV выписки: пути к файлу или содержимого в байтах
+
+    Файл отображается в память, границы строк и разделители ищутся прямо
+    в байтах, декодируются только колонки, нужные для PlatonOperation.
+    BOM перед заголовком пропускается. Строки с кавычками (в том числе
+    записи, поле которых в кавычках содержит перевод строки) разбираются
+    модулем csv.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        yield from _scan_operations(source)
+        return
+    with open(source, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield from _scan_operations(data)
+
+
+def _scan_operations(data):
+    """Разбирает операции из байтов выписки (bytes или mmap)"""
+    size = len(data)
+    if not size:
+        return
+    position = len(codecs.BOM_UTF8) if data[:len(codecs.BOM_UTF8)] == codecs.BOM_UTF8 else 0
+
+    line_end = data.find(b'\n', position)
+    if line_end == -1:
+        line_end = size
+    header = data[position:line_end].rstrip(b'\r')
+    delimiter = b';' if b';' in header else b','
+    names = [name.decode('utf-8').strip() for name in header.split(delimiter)]
+    columns = [names.index(column) if column in names else None for column in OPERATION_COLUMNS]
+
+    position = line_end + 1
+    while position < size:
+        start = position
+        line_end = data.find(b'\n', position)
+        if line_end == -1:
+            line_end = size
+        line = data[start:line_end]
+        if b'"' in line:
+            # Поле в кавычках может содержать перевод строки: запись
+            # продолжается, пока все кавычки не закроются
+            while line.count(b'"') % 2 and line_end < size:
+                line_end = data.find(b'\n', line_end + 1)
+                if line_end == -1:
+                    line_end = size
+                line = data[start:line_end]
+        line = line.rstrip(b'\r')
+        position = line_end + 1
+
+        if not line.strip():
+            continue
+        if b'"' in line:
+            row = next(csv.reader([line.decode('utf-8')], delimiter=delimiter.decode()))
+            fields = [value.encode('utf-8') for value in row]
+        else:
+            fields = line.split(delimiter)
+        yield _operation_from_fields(fields, columns)
+
+
+def _operation_from_fields(fields, columns):
+    """Собирает PlatonOperation из байтовых полей строки"""
+    values = [
+        fields[index].strip() if index is not None and index < len(fields) else b''
+        for index in columns
+    ]
+    timestamp, operation_id, operation_type, vehicle, road, device, amount, distance = values
+    return PlatonOperation(
+        timestamp=_parse_timestamp_bytes(timestamp),
+        operation_id=parse_int(operation_id),
+        operation_type=operation_type.decode('utf-8'),
+        vehicle=vehicle.decode('utf-8'),
+        road=road.decode('utf-8'),
+        device=device.decode('utf-8'),
+        kopecks=_parse_scaled_bytes(amount, 100),
+        meters=_parse_scaled_bytes(distance, 1000)
+    )
+
+
+def _parse_scaled_bytes(value, scale):
+    """parse_scaled для байтового поля"""
+    try:
+        return round(float(value.replace(b',', b'.')) * scale)
+    except ValueError:
+        return 0
+
+
+def _parse_timestamp_bytes(value):
+    """parse_timestamp для байтового поля с быстрым разбором 'дд.мм.гггг чч:мм:сс'"""
+    if len(value) == 19:
+        try:
+            return datetime(
+                int(value[6:10]), int(value[3:5]), int(value[0:2]),
+                int(value[11:13]), int(value[14:16]), int(value[17:19])
+            )
+        except ValueError:
+            pass
+    return parse_timestamp(value.decode('utf-8', 'replace'))
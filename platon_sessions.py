@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Хранилища пользовательских данных бота "Платон"
+Сводки для /summary и загруженные выписки с ограничением времени
+жизни и объема памяти
+"""
+
+import os
+import pickle
+import time
+from collections import OrderedDict
+
+
+class SessionStore:
+    """Сводки пользователей с вытеснением по времени и по объему
+
+    Запись живет ttl секунд с последнего сохранения. Суммарный размер
+    записей в памяти (по размеру pickle) не превышает max_bytes: при
+    превышении вытесняются записи, к которым дольше всего не обращались.
+    Если задан spill_dir, вытесненные записи сохраняются туда и
+    возвращаются в память при следующем обращении (пока не истек ttl).
+    """
+
+    def __init__(self, ttl, max_bytes, spill_dir=None):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        # user_id -> (истекает, размер, значение), от давно использованных к недавним
+        self.entries = OrderedDict()
+        self.used_bytes = 0
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def put(self, user_id, value):
+        """Сохраняет сводку пользователя"""
+        self.discard(user_id)
+        self._purge_expired()
+        size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        self._insert(user_id, time.time() + self.ttl, size, value)
+
+    def get(self, user_id):
+        """Возвращает сводку пользователя или None, если ее нет или она устарела"""
+        entry = self.entries.get(user_id)
+        if entry is not None:
+            expires, size, value = entry
+            if expires <= time.time():
+                self.discard(user_id)
+                return None
+            self.entries.move_to_end(user_id)
+            return value
+
+        # Запись могла быть вытеснена на диск
+        path = self._spill_path(user_id)
+        if path is None or not os.path.exists(path):
+            return None
+        with open(path, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            expires, value = pickle.load(file)
+        os.remove(path)
+        if expires <= time.time():
+            return None
+        self._insert(user_id, expires, size, value)
+        return value
+
+    def discard(self, user_id):
+        """Удаляет сводку пользователя из памяти и с диска"""
+        entry = self.entries.pop(user_id, None)
+        if entry is not None:
+            self.used_bytes -= entry[1]
+        path = self._spill_path(user_id)
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+
+    def _insert(self, user_id, expires, size, value):
+        """Кладет запись в память и вытесняет давно использованные сверх max_bytes"""
+        self.entries[user_id] = (expires, size, value)
+        self.used_bytes += size
+        while self.used_bytes > self.max_bytes and self.entries:
+            evicted_id, (evicted_expires, evicted_size, evicted_value) = self.entries.popitem(last=False)
+            self.used_bytes -= evicted_size
+            self._spill(evicted_id, evicted_expires, evicted_value)
+
+    def _spill(self, user_id, expires, value):
+        """Сохраняет вытесненную запись на диск, если это настроено"""
+        path = self._spill_path(user_id)
+        if path is None:
+            return
+        with open(path, 'wb') as file:
+            pickle.dump((expires, value), file, pickle.HIGHEST_PROTOCOL)
+        # Время изменения файла — срок жизни записи: устаревшие файлы
+        # находятся без чтения содержимого
+        os.utime(path, (expires, expires))
+
+    def _purge_expired(self):
+        """Удаляет устаревшие записи из памяти и с диска"""
+        now = time.time()
+        for user_id in [user_id for user_id, (expires, _, _) in self.entries.items() if expires <= now]:
+            self.discard(user_id)
+
+        if not self.spill_dir:
+            return
+        with os.scandir(self.spill_dir) as files:
+            for file in files:
+                try:
+                    if file.name.endswith('.pickle') and file.stat().st_mtime <= now:
+                        os.remove(file.path)
+                except OSError:
+                    continue
+
+    def _spill_path(self, user_id):
+        """Файл вытесненной записи пользователя"""
+        if not self.spill_dir:
+            return None
+        return os.path.join(self.spill_dir, f"{user_id}.pickle")
+
+
+class UploadLimitError(Exception):
+    """Загрузка превышает ограничение на число или объем выписок пользователя"""
+
+
+class UploadStore:
+    """Загруженные выписки пользователей с ограничением числа, объема и времени жизни
+
+    У пользователя не больше max_files выписок общим размером не больше
+    max_bytes. Выписки живут ttl секунд с последней загрузки, как сводки
+    в SessionStore; устаревшие выписки всех пользователей удаляются при
+    обращении к хранилищу. Удаляемая выписка передается в release
+    (например, чтобы удалить ее временный файл).
+    """
+
+    def __init__(self, ttl, max_files, max_bytes, release=None):
+        self.ttl = ttl
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.release = release
+        # user_id -> (истекает, [(размер, выписка), ...] в порядке загрузки)
+        self.entries = {}
+
+    def check(self, user_id, size):
+        """Проверяет, что выписку размера size (None — неизвестен) можно добавить
+
+        Raises:
+            UploadLimitError: Если выписка превысит ограничение пользователя
+        """
+        uploads = self._uploads(user_id)
+        if len(uploads) >= self.max_files:
+            raise UploadLimitError(f"не больше {self.max_files} файлов")
+        used = sum(upload_size for upload_size, _ in uploads)
+        if used + (size or 0) > self.max_bytes:
+            raise UploadLimitError(f"не больше {self.max_bytes / (1024 * 1024):.0f} МБ")
+
+    def add(self, user_id, upload, size):
+        """Добавляет выписку пользователя и продлевает время жизни его выписок
+
+        Raises:
+            UploadLimitError: Если выписка превысит ограничение пользователя;
+                в этом случае она сразу освобождается
+        """
+        try:
+            self.check(user_id, size)
+        except UploadLimitError:
+            self._release(upload)
+            raise
+        uploads = self._uploads(user_id)
+        uploads.append((size, upload))
+        self.entries[user_id] = (time.time() + self.ttl, uploads)
+
+    def get(self, user_id):
+        """Возвращает выписки пользователя в порядке загрузки"""
+        return [upload for _, upload in self._uploads(user_id)]
+
+    def remove(self, user_id, uploads):
+        """Удаляет и освобождает указанные выписки; остальные остаются"""
+        removed = {id(upload) for upload in uploads}
+        entry = self.entries.get(user_id)
+        if entry is None:
+            return
+        expires, kept = entry
+        for _, upload in kept:
+            if id(upload) in removed:
+                self._release(upload)
+        kept = [(size, upload) for size, upload in kept if id(upload) not in removed]
+        if kept:
+            self.entries[user_id] = (expires, kept)
+        else:
+            del self.entries[user_id]
+
+    def clear(self, user_id):
+        """Удаляет и освобождает все выписки пользователя"""
+        entry = self.entries.pop(user_id, None)
+        if entry is not None:
+            for _, upload in entry[1]:
+                self._release(upload)
+
+    def _uploads(self, user_id):
+        """Выписки пользователя (список из entries) после удаления устаревших"""
+        self._purge_expired()
+        entry = self.entries.get(user_id)
+        return entry[1] if entry is not None else []
+
+    def _purge_expired(self):
+        """Удаляет устаревшие выписки всех пользователей"""
+        now = time.time()
+        for user_id in [user_id for user_id, (expires, _) in self.entries.items() if expires <= now]:
+            self.clear(user_id)
+
+    def _release(self, upload):
+        """Освобождает удаляемую выписку"""
+        if self.release is not None:
+            self.release(upload)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Локальное хранилище операций системы "Платон" (SQLite)
+Хранит уже загруженные операции и итоги по ним, чтобы повторная
+загрузка выписок добавляла только новые операции
+"""
+
+import sqlite3
+from datetime import date
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS operations (
+    month TEXT NOT NULL,
+    operation_id INTEGER NOT NULL,
+    timestamp TEXT,
+    day TEXT NOT NULL,
+    operation_type TEXT NOT NULL,
+    vehicle TEXT NOT NULL,
+    road TEXT NOT NULL,
+    device TEXT NOT NULL,
+    kopecks INTEGER NOT NULL,
+    meters INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS operations_month_id ON operations (month, operation_id);
+
+CREATE TABLE IF NOT EXISTS cells (
+    month TEXT NOT NULL,
+    day TEXT NOT NULL,
+    vehicle TEXT NOT NULL,
+    road TEXT NOT NULL,
+    operation_type TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    kopecks INTEGER NOT NULL,
+    meters INTEGER NOT NULL,
+    charged INTEGER NOT NULL,
+    PRIMARY KEY (month, day, vehicle, road, operation_type)
+);
+'''
+
+ROW_COLUMNS = (
+    'month, operation_id, timestamp, day, operation_type, '
+    'vehicle, road, device, kopecks, meters'
+)
+
+
+class PlatonStore:
+    """Хранилище операций Платон с разбиением по месяцам
+
+    Строки для add_rows — кортежи в порядке ROW_COLUMNS: месяц 'YYYY-MM'
+    и день 'YYYY-MM-DD' (пустые строки, если дата неизвестна), номер
+    операции (0, если его нет), суммы в копейках и расстояния в метрах. Рядом с операциями хранится таблица
+    итогов cells, поэтому отчет строится без повторного прохода по операциям.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+        self.connection.execute(
+            f'CREATE TEMP TABLE IF NOT EXISTS incoming AS SELECT {ROW_COLUMNS} FROM operations WHERE 0'
+        )
+
+    def close(self):
+        """Закрывает соединение с базой"""
+        self.connection.close()
+
+    def add_rows(self, rows):
+        """Добавляет операции одной выписки, пропуская уже сохраненные
+
+        Returns:
+            tuple: (добавлено, пропущено)
+        """
+        with self.connection:
+            cursor = self.connection.cursor()
+            cursor.execute('DELETE FROM incoming')
+            cursor.executemany(f'INSERT INTO incoming ({ROW_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            total = cursor.execute('SELECT COUNT(*) FROM incoming').fetchone()[0]
+
+            # Операция с тем же номером уже лежит в том же месяце, так как
+            # номер однозначно определяет дату операции
+            cursor.execute('''
+                DELETE FROM incoming
+                WHERE operation_id != 0 AND EXISTS (
+                    SELECT 1 FROM operations
+                    WHERE operations.month = incoming.month
+                      AND operations.operation_id = incoming.operation_id
+                )
+            ''')
+            skipped = cursor.rowcount
+            added = total - skipped
+
+            cursor.execute(f'INSERT INTO operations ({ROW_COLUMNS}) SELECT {ROW_COLUMNS} FROM incoming')
+            cursor.execute('''
+                INSERT INTO cells (month, day, vehicle, road, operation_type, count, kopecks, meters, charged)
+                SELECT month, day, vehicle, road, operation_type,
+                       COUNT(*), SUM(kopecks), SUM(meters), SUM(kopecks != 0)
+                FROM incoming
+                WHERE 1
+                GROUP BY month, day, vehicle, road, operation_type
+                ON CONFLICT (month, day, vehicle, road, operation_type) DO UPDATE SET
+                    count = count + excluded.count,
+                    kopecks = kopecks + excluded.kopecks,
+                    meters = meters + excluded.meters,
+                    charged = charged + excluded.charged
+            ''')
+            cursor.execute('DELETE FROM incoming')
+        return added, skipped
+
+    def months(self):
+        """Возвращает список месяцев, по которым есть операции"""
+        rows = self.connection.execute('SELECT DISTINCT month FROM cells ORDER BY month')
+        return [month for (month,) in rows]
+
+    def load_cells(self, months=None):
+        """Возвращает итоги в формате PlatonAggregator.cells (копейки и метры)
+
+        Args:
+            months: Месяцы 'YYYY-MM' для отчета, None — все месяцы
+        """
+        query = 'SELECT vehicle, road, operation_type, day, count, kopecks, meters, charged FROM cells'
+        params = []
+        if months is not None:
+            if not months:
+                return {}
+            months = sorted(months)
+            query += f" WHERE month IN ({', '.join('?' for _ in months)})"
+            params = months
+
+        cells = {}
+        for vehicle, road, operation_type, day, count, kopecks, meters, charged in self.connection.execute(query, params):
+            day = date.fromisoformat(day) if day else None
+            cells[(vehicle, road, operation_type, day)] = [count, kopecks, meters, charged]
+        return cells
@@ -5,18 +5,71 @@ Telegram бот для обработки данных системы "Плат
 """
 
 import os
+import json
+import signal
+import time
+import asyncio
 import logging
+import multiprocessing
 import tempfile
+import weakref
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import TelegramError
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes
-from platon_processor import PlatonProcessor
-from dotenv import load_dotenv
-from flask import Flask
+from platon_sessions import SessionStore, UploadStore, UploadLimitError
+from platon_http import HttpServer, text_response
+from platon_metrics import MetricsRegistry, resident_memory_bytes, children_resident_memory_bytes
 from threading import Thread
 
+# Тяжелые библиотеки (pandas, openpyxl в platon_processor, flask) импортируются
+# при первом использовании, чтобы бот быстрее начинал отвечать после запуска.
+# Модуль обработки нужен только в процессах пула: задачи пула ниже
+# импортируют его там, а не в процессе бота
+
+def load_env_file():
+    """Загружает .env из текущей папки или папки бота, если файл есть"""
+    for directory in (os.getcwd(), os.path.dirname(os.path.abspath(__file__))):
+        path = os.path.join(directory, '.env')
+        if os.path.exists(path):
+            from dotenv import load_dotenv
+            load_dotenv(path)
+            return
+
+def processing():
+    """Модуль обработки выписок (импортируется в процессах пула при первой задаче или при прогреве)"""
+    import platon_processor
+    return platon_processor
+
+def warm_up_worker():
+    """Задача прогрева: загружает модуль обработки в процессе пула"""
+    processing()
+
+def parse_upload_worker(upload, streaming: bool):
+    """Задача пула: разбирает выписку и сохраняет часть на диск, возвращает путь к части"""
+    return processing().spill_statement_part(upload, streaming)
+
+def render_uploads_worker(statements, streaming: bool):
+    """Задача пула: объединяет части выписок и строит отчет (см. render_parts)"""
+    return compact_result(processing().render_parts(statements, streaming))
+
+def build_report_worker(*args):
+    """Задача пула: полный цикл обработки с хранилищем (см. build_report)"""
+    return compact_result(processing().build_report(*args))
+
+def compact_result(result):
+    """Результат отчета для процесса бота: (компактная сводка, статистика обработки, отчет)
+    
+    Полная сводка с DataFrame остается в процессе пула.
+    """
+    if result is None:
+        return None
+    summary, report = result
+    return compact_summary(summary), summary['processing'], report
+
 # Загружаем переменные окружения
-load_dotenv()
+load_env_file()
 
 # Настройка логирования
 logging.basicConfig(
@@ -25,30 +78,258 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Потоковый режим обработки: постоянный расход памяти, но без листа "Детальные данные"
+STREAMING_MODE = os.getenv('PLATON_STREAMING', '0') == '1'
+# Каталог SQLite-хранилищ операций (по файлу на пользователя).
+# Если задан, повторно загруженные операции не обрабатываются заново,
+# а отчет строится по всем сохраненным операциям затронутых месяцев
+STORE_DIR = os.getenv('PLATON_STORE_DIR', '')
+# Количество процессов, в которых строятся отчеты /process. Обработка не
+# выполняется в цикле событий, поэтому бот отвечает другим пользователям,
+# пока строится отчет
+REPORT_WORKERS = int(os.getenv('PLATON_REPORT_WORKERS', '1'))
+# Сколько задач /process выполняется одновременно и сколько может ждать в очереди
+MAX_ACTIVE_JOBS = int(os.getenv('PLATON_MAX_ACTIVE_JOBS', str(REPORT_WORKERS)))
+MAX_QUEUED_JOBS = int(os.getenv('PLATON_MAX_QUEUED_JOBS', '10'))
+# Сколько обновлений Telegram обрабатывается одновременно. Пока /process
+# ждет пула процессов, бот отвечает на остальные сообщения
+CONCURRENT_UPDATES = int(os.getenv('PLATON_CONCURRENT_UPDATES', '32'))
+# Выписки не больше этого размера (в байтах) хранятся и разбираются в памяти,
+# более крупные сохраняются во временный файл
+MEMORY_UPLOAD_LIMIT = int(os.getenv('PLATON_MEMORY_UPLOAD_LIMIT', str(8 * 1024 * 1024)))
+# Загруженные, но не обработанные выписки: сколько файлов и байт может быть
+# у пользователя и сколько секунд они хранятся после последней загрузки
+MAX_UPLOAD_FILES = int(os.getenv('PLATON_MAX_UPLOAD_FILES', '20'))
+MAX_UPLOAD_BYTES = int(os.getenv('PLATON_MAX_UPLOAD_BYTES', str(100 * 1024 * 1024)))
+UPLOAD_TTL = int(os.getenv('PLATON_UPLOAD_TTL', str(6 * 60 * 60)))
+# Сводки для /summary: время жизни (секунды), общий объем в памяти (байты)
+# и каталог, куда вытесняются сводки сверх объема (пусто — не сохранять)
+SESSION_TTL = int(os.getenv('PLATON_SESSION_TTL', str(24 * 60 * 60)))
+SESSION_MEMORY_LIMIT = int(os.getenv('PLATON_SESSION_MEMORY_LIMIT', str(16 * 1024 * 1024)))
+SESSION_DIR = os.getenv('PLATON_SESSION_DIR', '')
+# Сколько ТС и дорог показывает /summary
+SUMMARY_TOP = 5
+# Режим получения обновлений: polling (по умолчанию) или webhook.
+# В режиме webhook один HTTP сервер принимает обновления Telegram и
+# отвечает на /health и /ping. Без PLATON_WEBHOOK_URL (и RENDER_EXTERNAL_URL
+# на Render) вебхук не регистрируется: сервер работает как локальная
+# замена Telegram, обновления можно отправлять POST-запросами на WEBHOOK_PATH
+BOT_MODE = os.getenv('PLATON_BOT_MODE', 'polling')
+WEBHOOK_URL = os.getenv('PLATON_WEBHOOK_URL') or os.getenv('RENDER_EXTERNAL_URL', '')
+WEBHOOK_SECRET = os.getenv('PLATON_WEBHOOK_SECRET', '')
+WEBHOOK_PATH = '/telegram'
+# Адрес Bot API (например, локальной замены Telegram для замеров запуска)
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', '')
+# Прогрев после запуска: процессы пула запускаются в фоне и загружают модуль обработки
+WARM_UP = os.getenv('PLATON_WARM_UP', '1') == '1'
+
+# Метрики для /metrics (формат Prometheus)
+METRICS = MetricsRegistry()
+PHASE_SECONDS = METRICS.histogram(
+    'platon_phase_seconds', 'Длительность этапов обработки выписок (загрузка, разбор, итоги, Excel)', 'phase'
+)
+HANDLER_SECONDS = METRICS.histogram('platon_handler_seconds', 'Длительность обработчиков бота', 'handler')
+FILES_PROCESSED = METRICS.counter('platon_files_processed_total', 'Обработано файлов выписок')
+ROWS_PROCESSED = METRICS.counter('platon_rows_processed_total', 'Обработано строк выписок')
+METRICS.gauge('process_resident_memory_bytes', 'RSS процесса бота', resident_memory_bytes)
+METRICS.gauge('platon_workers_resident_memory_bytes', 'Суммарный RSS процессов обработки', children_resident_memory_bytes)
+
+def upload_available(upload) -> bool:
+    """Проверяет, что загруженная выписка (байты или путь к файлу) еще доступна"""
+    return isinstance(upload, (bytes, bytearray)) or os.path.exists(upload)
+
+def compact_summary(summary: dict) -> dict:
+    """Оставляет из сводки PlatonProcessor только то, что показывает /summary"""
+    return {
+        'total_records': summary['total_records'],
+        'total_amount': summary['total_amount'],
+        'total_distance': summary['total_distance'],
+        'vehicles_count': len(summary['vehicles']),
+        'roads_count': len(summary['roads']),
+        'duplicates_skipped': summary.get('duplicates_skipped', 0),
+        'already_stored': summary.get('already_stored', 0),
+        # Рейтинги уже посчитаны при обработке, здесь только обрезаются
+        'rankings': {
+            dimension: leaders[:SUMMARY_TOP]
+            for dimension, leaders in summary['rankings'].items()
+        }
+    }
+
+def remove_upload(upload):
+    """Удаляет временный файл выписки; выписки в памяти освобождаются сами"""
+    if isinstance(upload, str) and os.path.exists(upload):
+        os.remove(upload)
+
+def remove_part(task: asyncio.Task):
+    """Удаляет файл части, сохраненной задачей разбора"""
+    if task.cancelled() or task.exception() is not None:
+        return
+    remove_upload(task.result())
+
+class StatementUpload:
+    """Загруженная выписка: имя файла и содержимое (байты или путь к временному файлу)
+    
+    part — задача фонового разбора; ее результат — путь к разобранной
+    части на диске (или None). В процессе бота части не хранятся.
+    """
+    
+    def __init__(self, name: str, source):
+        self.name = name
+        self.source = source
+        self.part = None
+    
+    def release(self):
+        """Освобождает выписку, удаляя ее временный файл и файл части"""
+        remove_upload(self.source)
+        if self.part is not None:
+            # Разбор может еще идти: часть удаляется, когда он закончится
+            self.part.add_done_callback(remove_part)
+
+class JobScheduler:
+    """Очередь тяжелых задач бота
+    
+    Одновременно выполняется не больше max_active задач, у пользователя
+    не больше одной задачи (выполняемой или ожидающей), в очереди не
+    больше max_queued задач. Ожидающие задачи запускаются по порядку.
+    """
+    
+    def __init__(self, max_active: int, max_queued: int):
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.active = set()
+        self.waiting = []
+        self.changed = asyncio.Condition()
+    
+    def position(self, user_id):
+        """Позиция задачи пользователя: 0 — выполняется, None — задачи нет"""
+        if user_id in self.active:
+            return 0
+        if user_id in self.waiting:
+            return self.waiting.index(user_id) + 1
+        return None
+    
+    def enqueue(self, user_id):
+        """Ставит задачу пользователя в очередь
+        
+        Returns:
+            int: Позиция в очереди (0 — задача запустится сразу) или None, если очередь заполнена
+        """
+        if len(self.active) < self.max_active and not self.waiting:
+            self.active.add(user_id)
+            return 0
+        if len(self.waiting) >= self.max_queued:
+            return None
+        self.waiting.append(user_id)
+        return len(self.waiting)
+    
+    async def wait_turn(self, user_id, on_position=None):
+        """Ждет, пока задача пользователя не станет выполняемой
+        
+        Задачи из очереди запускает finish, освобождая место, поэтому
+        здесь достаточно дождаться, когда пользователь окажется в active.
+        on_position вызывается без блокировки очереди: медленный вызов не
+        задерживает finish других задач, а ошибка в нем не снимает задачу.
+        
+        Args:
+            user_id: Пользователь, поставленный в очередь через enqueue
+            on_position: Корутина, вызываемая с новой позицией при движении очереди
+        """
+        reported = self.position(user_id)
+        try:
+            while True:
+                async with self.changed:
+                    while user_id not in self.active and self.position(user_id) == reported:
+                        await self.changed.wait()
+                    if user_id in self.active:
+                        return
+                    reported = self.position(user_id)
+                if on_position is not None:
+                    try:
+                        await on_position(reported)
+                    except Exception as e:
+                        logger.warning(f"Не удалось сообщить позицию в очереди: {e}")
+        except BaseException:
+            if user_id in self.waiting:
+                self.waiting.remove(user_id)
+                async with self.changed:
+                    self.changed.notify_all()
+            raise
+    
+    async def finish(self, user_id):
+        """Освобождает место задачи пользователя (выполняемой или ожидающей)
+        
+        Освободившиеся места сразу занимают первые задачи очереди.
+        """
+        async with self.changed:
+            self.active.discard(user_id)
+            if user_id in self.waiting:
+                self.waiting.remove(user_id)
+            while self.waiting and len(self.active) < self.max_active:
+                self.active.add(self.waiting.pop(0))
+            self.changed.notify_all()
+
 class PlatonTelegramBot:
     """Telegram бот для обработки данных системы Платон"""
     
     def __init__(self, token: str):
         self.token = token
-        self.application = Application.builder().token(token).build()
+        builder = (
+            Application.builder().token(token)
+            .concurrent_updates(CONCURRENT_UPDATES)
+            .post_init(self._post_init)
+        )
+        if TELEGRAM_API_URL:
+            builder = builder.base_url(f"{TELEGRAM_API_URL}/bot").base_file_url(f"{TELEGRAM_API_URL}/file/bot")
+        self.application = builder.build()
         self.processor = None
+        self.warm_up_task = None
+        # Процессы создаются при первой задаче. Метод spawn: fork из процесса
+        # с потоками и циклом событий может унаследовать захваченные блокировки
+        self.executor = ProcessPoolExecutor(
+            max_workers=REPORT_WORKERS,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+        self.jobs = JobScheduler(MAX_ACTIVE_JOBS, MAX_QUEUED_JOBS)
+        self.sessions = SessionStore(SESSION_TTL, SESSION_MEMORY_LIMIT, SESSION_DIR or None)
+        self.uploads = UploadStore(UPLOAD_TTL, MAX_UPLOAD_FILES, MAX_UPLOAD_BYTES, StatementUpload.release)
+        # Обновления обрабатываются параллельно: загрузки, /clear и выбор
+        # файлов для /process одного пользователя выполняются по очереди
+        self.user_locks = weakref.WeakValueDictionary()
+        METRICS.gauge('platon_active_jobs', 'Выполняемые задачи /process', lambda: len(self.jobs.active))
+        METRICS.gauge('platon_queued_jobs', 'Задачи /process в очереди', lambda: len(self.jobs.waiting))
         self.setup_handlers()
     
     def setup_handlers(self):
         """Настройка обработчиков команд"""
         # Команды
-        self.application.add_handler(CommandHandler("start", self.start_command))
-        self.application.add_handler(CommandHandler("help", self.help_command))
-        self.application.add_handler(CommandHandler("process", self.process_command))
-        self.application.add_handler(CommandHandler("summary", self.summary_command))
-        self.application.add_handler(CommandHandler("clear", self.clear_command))
-        self.application.add_handler(CommandHandler("files", self.files_command))
+        self.application.add_handler(CommandHandler("start", self.timed("start", self.start_command)))
+        self.application.add_handler(CommandHandler("help", self.timed("help", self.help_command)))
+        self.application.add_handler(CommandHandler("process", self.timed("process", self.process_command)))
+        self.application.add_handler(CommandHandler("summary", self.timed("summary", self.summary_command)))
+        self.application.add_handler(CommandHandler("clear", self.timed("clear", self.clear_command)))
+        self.application.add_handler(CommandHandler("files", self.timed("files", self.files_command)))
         
         # Обработка файлов
-        self.application.add_handler(MessageHandler(filters.Document.ALL, self.handle_document))
+        self.application.add_handler(MessageHandler(filters.Document.ALL, self.timed("document", self.handle_document)))
         
         # Обработка callback запросов
-        self.application.add_handler(CallbackQueryHandler(self.button_callback))
+        self.application.add_handler(CallbackQueryHandler(self.timed("callback", self.button_callback)))
+    
+    @staticmethod
+    def timed(name: str, handler):
+        """Оборачивает обработчик замером длительности для метрик"""
+        async def timed_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            with HANDLER_SECONDS.time(name):
+                await handler(update, context)
+        return timed_handler
+    
+    def _user_lock(self, user_id) -> asyncio.Lock:
+        """Блокировка изменений загруженных файлов пользователя"""
+        lock = self.user_locks.get(user_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self.user_locks[user_id] = lock
+        return lock
     
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /start"""
@@ -126,20 +407,12 @@ class PlatonTelegramBot:
     async def clear_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /clear"""
         try:
-            # Очищаем загруженные файлы
-            if 'csv_files' in context.user_data:
-                for file_path in context.user_data['csv_files']:
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
-                context.user_data['csv_files'] = []
-            
-            # Очищаем список имен файлов
-            if 'file_names' in context.user_data:
-                context.user_data['file_names'] = []
-            
-            # Очищаем процессор
-            if 'processor' in context.user_data:
-                del context.user_data['processor']
+            async with self._user_lock(update.effective_user.id):
+                # Очищаем загруженные файлы
+                self.uploads.clear(update.effective_user.id)
+                
+                # Очищаем сводку
+                self.sessions.discard(update.effective_user.id)
             
             await update.message.reply_text(
                 "🧹 Все данные очищены!\n\n"
@@ -152,7 +425,8 @@ class PlatonTelegramBot:
     
     async def files_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /files - показывает список загруженных файлов"""
-        if 'file_names' not in context.user_data or not context.user_data['file_names']:
+        uploads = self.uploads.get(update.effective_user.id)
+        if not uploads:
             await update.message.reply_text(
                 "📁 Нет загруженных файлов.\n\n"
                 "Отправьте CSV файл с данными системы Платон."
@@ -160,10 +434,10 @@ class PlatonTelegramBot:
             return
         
         files_list = "📁 *Загруженные файлы:*\n\n"
-        for i, filename in enumerate(context.user_data['file_names'], 1):
-            files_list += f"{i}. `{filename}`\n"
+        for i, upload in enumerate(uploads, 1):
+            files_list += f"{i}. `{upload.name}`\n"
         
-        files_list += f"\n📊 Всего файлов: {len(context.user_data['file_names'])}\n"
+        files_list += f"\n📊 Всего файлов: {len(uploads)}\n"
         files_list += "🔄 Используйте /process для обработки данных"
         
         await update.message.reply_text(files_list, parse_mode='Markdown')
@@ -179,44 +453,60 @@ class PlatonTelegramBot:
             )
             return
         
+        user_id = update.effective_user.id
         try:
-            # Инициализируем список файлов если его нет
-            if 'csv_files' not in context.user_data:
-                context.user_data['csv_files'] = []
-                context.user_data['file_names'] = []
+            # Загрузки пользователя добавляются по одной, в порядке прихода
+            async with self._user_lock(user_id):
+                # Проверяем ограничение до скачивания, если размер известен
+                self.uploads.check(user_id, document.file_size)
+                
+                # Проверяем на дублирование имен файлов
+                if any(upload.name == document.file_name for upload in self.uploads.get(user_id)):
+                    warning_msg = (
+                        f"⚠️ *Внимание! Обнаружено два файла с одинаковым названием:*\n"
+                        f"`{document.file_name}`\n\n"
+                        f"Возможно наложение данных! Рекомендуется использовать уникальные имена файлов."
+                    )
+                    await update.message.reply_text(warning_msg, parse_mode='Markdown')
             
-            # Проверяем на дублирование имен файлов
-            if document.file_name in context.user_data['file_names']:
-                warning_msg = (
-                    f"⚠️ *Внимание! Обнаружено два файла с одинаковым названием:*\n"
-                    f"`{document.file_name}`\n\n"
-                    f"Возможно наложение данных! Рекомендуется использовать уникальные имена файлов."
-                )
-                await update.message.reply_text(warning_msg, parse_mode='Markdown')
+                # Скачиваем файл
+                file = await context.bot.get_file(document.file_id)
             
-            # Скачиваем файл
-            file = await context.bot.get_file(document.file_id)
+                # Небольшие выписки остаются в памяти, крупные сохраняются во временный файл
+                with PHASE_SECONDS.time('download'):
+                    if document.file_size is not None and document.file_size <= MEMORY_UPLOAD_LIMIT:
+                        upload = bytes(await file.download_as_bytearray())
+                    else:
+                        with tempfile.NamedTemporaryFile(mode='wb', suffix='.csv', delete=False) as temp_file:
+                            await file.download_to_drive(temp_file.name)
+                            upload = temp_file.name
+                size = len(upload) if isinstance(upload, bytes) else os.path.getsize(upload)
             
-            # Создаем временный файл
-            with tempfile.NamedTemporaryFile(mode='wb', suffix='.csv', delete=False) as temp_file:
-                await file.download_to_drive(temp_file.name)
-                temp_file_path = temp_file.name
+                # Добавляем файл в список (не заменяем, а добавляем)
+                statement = StatementUpload(document.file_name, upload)
+                self.uploads.add(user_id, statement, size)
             
-            # Добавляем файл в список (не заменяем, а добавляем)
-            context.user_data['csv_files'].append(temp_file_path)
-            context.user_data['file_names'].append(document.file_name)
+                # Выписка разбирается сразу, пока пользователь загружает остальные.
+                # С хранилищем операции записываются в него только при /process
+                if not STORE_DIR:
+                    statement.part = asyncio.create_task(self._parse_upload(upload))
             
-            # Очищаем предыдущий процессор при загрузке нового файла
-            if 'processor' in context.user_data:
-                del context.user_data['processor']
+                # Очищаем предыдущую сводку при загрузке нового файла
+                self.sessions.discard(user_id)
+                files_count = len(self.uploads.get(user_id))
             
             await update.message.reply_text(
                 f"✅ Файл *{document.file_name}* успешно загружен!\n\n"
-                f"📁 Загружено файлов: {len(context.user_data['csv_files'])}\n"
+                f"📁 Загружено файлов: {files_count}\n"
                 f"🔄 Используйте /process для обработки данных",
                 parse_mode='Markdown'
             )
             
+        except UploadLimitError as e:
+            await update.message.reply_text(
+                f"🚫 Слишком много загруженных файлов: {e}.\n\n"
+                "Обработайте их командой /process или очистите командой /clear."
+            )
         except Exception as e:
             logger.error(f"Ошибка при загрузке файла: {e}")
             await update.message.reply_text(
@@ -225,80 +515,162 @@ class PlatonTelegramBot:
     
     async def process_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /process"""
-        if 'csv_files' not in context.user_data or not context.user_data['csv_files']:
-            await update.message.reply_text(
+        # Команда приходит и сообщением, и нажатием кнопки
+        message = update.effective_message
+        user_id = update.effective_user.id
+        if not self.uploads.get(user_id):
+            await message.reply_text(
                 "❌ Сначала загрузите CSV файлы!\n\n"
                 "Отправьте CSV файл с данными системы Платон, а затем используйте /process"
             )
             return
         
+        # Повторные нажатия, пока отчет строится или ждет очереди, не создают новых задач
+        position = self.jobs.position(user_id)
+        if position is not None:
+            await message.reply_text(
+                "⏳ Ваш отчет уже строится." if position == 0 else
+                f"⏳ Ваш отчет уже в очереди, позиция: {position}."
+            )
+            return
+        
+        position = self.jobs.enqueue(user_id)
+        if position is None:
+            await message.reply_text("🚦 Сейчас слишком много отчетов в очереди. Попробуйте через несколько минут.")
+            return
+        
         try:
             # Показываем, что началась обработка
-            processing_msg = await update.message.reply_text("🔄 Обрабатываю данные... Пожалуйста, подождите.")
-            
-            # Создаем процессор
-            processor = PlatonProcessor()
+            if position == 0:
+                processing_msg = await message.reply_text("🔄 Обрабатываю данные... Пожалуйста, подождите.")
+            else:
+                processing_msg = await message.reply_text(f"🕒 Отчет поставлен в очередь, позиция: {position}.")
+                
+                async def report_position(position):
+                    await self._edit_status(processing_msg, f"🕒 Отчет в очереди, позиция: {position}.")
+                
+                await self.jobs.wait_turn(user_id, report_position)
+                await self._edit_status(processing_msg, "🔄 Обрабатываю данные... Пожалуйста, подождите.")
             
-            # Обрабатываем каждый файл
-            for csv_file in context.user_data['csv_files']:
-                if os.path.exists(csv_file):
-                    processor.read_csv_file(csv_file)
+            # Чтение, обработка и Excel отчет выполняются в пуле процессов.
+            # Берутся файлы, загруженные к началу обработки
+            report_name = f"отчет_платон_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+            loop = asyncio.get_running_loop()
+            if STORE_DIR:
+                # Загрузка, начатая до /process, успевает попасть в отчет
+                async with self._user_lock(user_id):
+                    job_uploads = self.uploads.get(user_id)
+                existing_files = [upload.source for upload in job_uploads if upload_available(upload.source)]
+                result = await loop.run_in_executor(
+                    self.executor, build_report_worker,
+                    existing_files, STREAMING_MODE,
+                    self._store_path(user_id)
+                )
+            else:
+                # Выписки разобраны при загрузке: рабочий процесс объединяет
+                # сохраненные части в порядке загрузки и строит отчет
+                async with self._user_lock(user_id):
+                    job_uploads = self.uploads.get(user_id)
+                statements = []
+                for upload in job_uploads:
+                    if not upload_available(upload.source):
+                        continue
+                    part_path = None
+                    if upload.part is not None:
+                        await asyncio.wait([upload.part])
+                        part_path = upload.part.result()
+                    statements.append((upload.source, part_path))
+                result = await loop.run_in_executor(
+                    self.executor, render_uploads_worker, statements, STREAMING_MODE
+                )
             
-            if not processor.data:
+            if result is None:
                 await processing_msg.edit_text("❌ Не удалось загрузить данные из файлов")
                 return
+            summary, processing_stats, report = result
+            self._record_processing(processing_stats)
             
-            # Обрабатываем данные
-            processor.process_data()
+            # Отправляем Excel файл прямо из памяти
+            await context.bot.send_document(
+                chat_id=update.effective_chat.id,
+                document=report,
+                filename=report_name,
+                caption="📊 Excel отчет готов!"
+            )
             
-            # Создаем Excel отчет
-            output_file = f"отчет_платон_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-            if processor.create_excel_report(output_file):
-                # Отправляем Excel файл
-                with open(output_file, 'rb') as file:
-                    await context.bot.send_document(
-                        chat_id=update.effective_chat.id,
-                        document=file,
-                        filename=output_file,
-                        caption="📊 Excel отчет готов!"
-                    )
-                
-                # Удаляем временный файл
-                os.remove(output_file)
-                
-                # Сохраняем процессор в контексте для команды summary
-                context.user_data['processor'] = processor
-                
-                # Очищаем загруженные файлы после создания отчета
-                for csv_file in context.user_data['csv_files']:
-                    if os.path.exists(csv_file):
-                        os.remove(csv_file)
-                context.user_data['csv_files'] = []
-                context.user_data['file_names'] = []
-                
-                await processing_msg.edit_text(
-                    "✅ Обработка завершена! Excel отчет отправлен.\n\n"
-                    "📁 Загруженные файлы очищены. Можете загрузить новые файлы.\n"
-                    "Используйте /summary для просмотра сводки данных."
+            # Сохраняем компактную сводку для команды summary
+            self.sessions.put(user_id, summary)
+            
+            # Очищаем обработанные файлы; загруженные во время обработки остаются
+            self.uploads.remove(user_id, job_uploads)
+            
+            duplicates_text = ""
+            if summary['duplicates_skipped']:
+                duplicates_text = (
+                    f"♻️ Пропущено повторяющихся операций: {summary['duplicates_skipped']}\n"
+                    "(выписки пересекаются по периодам)\n\n"
                 )
-            else:
-                await processing_msg.edit_text("❌ Ошибка при создании Excel отчета")
+            if summary.get('already_stored'):
+                duplicates_text += (
+                    f"🗄 Операций, загруженных ранее (вошли в отчет из хранилища): {summary['already_stored']}\n\n"
+                )
+            
+            await processing_msg.edit_text(
+                "✅ Обработка завершена! Excel отчет отправлен.\n\n"
+                f"{duplicates_text}"
+                "📁 Загруженные файлы очищены. Можете загрузить новые файлы.\n"
+                "Используйте /summary для просмотра сводки данных."
+            )
                 
         except Exception as e:
             logger.error(f"Ошибка при обработке данных: {e}")
-            await update.message.reply_text(f"❌ Ошибка при обработке: {str(e)}")
+            await message.reply_text(f"❌ Ошибка при обработке: {str(e)}")
+        finally:
+            await self.jobs.finish(user_id)
+    
+    async def _edit_status(self, message, text: str):
+        """Обновляет сообщение о ходе обработки; ошибка Telegram не прерывает задачу"""
+        try:
+            await message.edit_text(text)
+        except TelegramError as e:
+            logger.warning(f"Не удалось обновить сообщение о статусе: {e}")
+    
+    def _record_processing(self, processing: dict):
+        """Переносит статистику обработки из рабочего процесса в метрики"""
+        FILES_PROCESSED.inc(processing['files'])
+        ROWS_PROCESSED.inc(processing['rows'])
+        for phase, seconds in processing['phase_timings']:
+            PHASE_SECONDS.observe(phase, seconds)
+    
+    async def _parse_upload(self, upload):
+        """Разбирает выписку в пуле процессов, возвращает путь к части или None
+        
+        Выписка без части будет прочитана заново при построении отчета.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, parse_upload_worker, upload, STREAMING_MODE)
+        except Exception as e:
+            logger.error(f"Ошибка при разборе загруженного файла: {e}")
+            return None
+    
+    def _store_path(self, user_id):
+        """Путь к хранилищу операций пользователя, если оно настроено"""
+        if not STORE_DIR:
+            return None
+        os.makedirs(STORE_DIR, exist_ok=True)
+        return os.path.join(STORE_DIR, f"{user_id}.sqlite3")
     
     async def summary_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /summary"""
-        if 'processor' not in context.user_data:
+        summary = self.sessions.get(update.effective_user.id)
+        if summary is None:
             await update.message.reply_text(
                 "❌ Сначала обработайте данные командой /process"
             )
             return
         
         try:
-            processor = context.user_data['processor']
-            summary = processor.summary
             
             summary_text = f"""
 📊 *Сводка по обработанным данным*
@@ -307,34 +679,20 @@ class PlatonTelegramBot:
 • Записей: {summary['total_records']:,}
 • Общая сумма: {summary['total_amount']:,.2f} руб.
 • Общее расстояние: {summary['total_distance']:,.2f} км
-• Транспортных средств: {len(summary['vehicles'])}
-• Дорог: {len(summary['roads'])}
+• Транспортных средств: {summary['vehicles_count']}
+• Дорог: {summary['roads_count']}
+• Пропущено повторов: {summary['duplicates_skipped']}
+• Загружено ранее (из хранилища): {summary.get('already_stored', 0)}
 
 🚛 *Топ-5 транспортных средств по расходам:*
 """
             
-            # Сортируем ТС по расходам
-            vehicle_costs = []
-            for vehicle, records in summary['by_vehicle'].items():
-                total_amount = sum(processor._parse_float(r.get('Списание с РЗ (руб.)', '0')) for r in records)
-                vehicle_costs.append((vehicle, total_amount))
-            
-            vehicle_costs.sort(key=lambda x: x[1], reverse=True)
-            
-            for i, (vehicle, amount) in enumerate(vehicle_costs[:5], 1):
+            for i, (vehicle, amount) in enumerate(summary['rankings']['vehicles'], 1):
                 summary_text += f"{i}. {vehicle}: {amount:,.2f} руб.\n"
             
             summary_text += f"\n🛣️ *Топ-5 дорог по расходам:*\n"
             
-            # Сортируем дороги по расходам
-            road_costs = []
-            for road, records in summary['by_road'].items():
-                total_amount = sum(processor._parse_float(r.get('Списание с РЗ (руб.)', '0')) for r in records)
-                road_costs.append((road, total_amount))
-            
-            road_costs.sort(key=lambda x: x[1], reverse=True)
-            
-            for i, (road, amount) in enumerate(road_costs[:5], 1):
+            for i, (road, amount) in enumerate(summary['rankings']['roads'], 1):
                 summary_text += f"{i}. {road[:50]}{'...' if len(road) > 50 else ''}: {amount:,.2f} руб.\n"
             
             await update.message.reply_text(summary_text, parse_mode='Markdown')
@@ -359,13 +717,111 @@ class PlatonTelegramBot:
         elif query.data == "help":
             await self.help_command(update, context)
     
+    async def _post_init(self, application: Application):
+        """Запускает прогрев после инициализации приложения, не задерживая ответы"""
+        if WARM_UP:
+            self.warm_up_task = asyncio.create_task(self.warm_up())
+    
+    async def warm_up(self):
+        """Запускает процессы пула в фоне и загружает в них модуль обработки
+        
+        В процессе бота модуль обработки не нужен и не загружается.
+        """
+        started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*(
+                loop.run_in_executor(self.executor, warm_up_worker) for _ in range(REPORT_WORKERS)
+            ))
+            logger.info(f"Прогрев завершен за {time.perf_counter() - started:.2f} с")
+        except Exception as e:
+            logger.error(f"Ошибка при прогреве: {e}")
+    
     def run(self):
         """Запуск бота"""
         logger.info("Запуск Telegram бота...")
-        self.application.run_polling()
+        try:
+            self.application.run_polling()
+        finally:
+            self.executor.shutdown(cancel_futures=True)
+    
+    def run_webhook(self, port: int):
+        """Запуск бота в режиме вебхука"""
+        logger.info(f"Запуск Telegram бота (вебхук, порт {port})...")
+        try:
+            asyncio.run(self.serve_webhook(port))
+        finally:
+            self.executor.shutdown(cancel_futures=True)
+    
+    async def serve_webhook(self, port: int):
+        """Обслуживает вебхук и служебные запросы одним HTTP сервером до SIGINT/SIGTERM"""
+        server = HttpServer()
+        server.route('GET', '/', self._home_endpoint)
+        server.route('GET', '/health', self._health_endpoint)
+        server.route('GET', '/ping', self._ping_endpoint)
+        server.route('GET', '/metrics', self._metrics_endpoint)
+        server.route('POST', WEBHOOK_PATH, self._webhook_endpoint)
+        
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        
+        async with self.application:
+            await self.application.start()
+            # post_init вызывается только в run_polling/run_webhook
+            await self._post_init(self.application)
+            if WEBHOOK_URL:
+                await self.application.bot.set_webhook(
+                    WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+                    secret_token=WEBHOOK_SECRET or None,
+                    allowed_updates=Update.ALL_TYPES
+                )
+                logger.info(f"Вебхук зарегистрирован: {WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}")
+            else:
+                logger.info(
+                    "PLATON_WEBHOOK_URL не задан, вебхук не регистрируется. "
+                    f"Обновления можно отправлять POST-запросами на http://localhost:{port}{WEBHOOK_PATH}"
+                )
+            await server.start('0.0.0.0', port)
+            try:
+                await stop.wait()
+            finally:
+                await server.close()
+                await self.application.stop()
+    
+    async def _webhook_endpoint(self, request):
+        """Принимает обновление Telegram и передает его в очередь приложения"""
+        if WEBHOOK_SECRET and request.headers.get('x-telegram-bot-api-secret-token') != WEBHOOK_SECRET:
+            return text_response("Forbidden", 403)
+        try:
+            update = Update.de_json(json.loads(request.body), self.application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.error(f"Некорректное обновление от Telegram: {e}")
+            return text_response("Bad Request", 400)
+        await self.application.update_queue.put(update)
+        return text_response("OK")
+    
+    async def _home_endpoint(self, request):
+        """Обработчик GET /"""
+        return text_response("Platon Telegram Bot is running!")
+    
+    async def _health_endpoint(self, request):
+        """Обработчик GET /health (проверка работоспособности на хостинге)"""
+        return text_response("OK")
+    
+    async def _metrics_endpoint(self, request):
+        """Обработчик GET /metrics (формат Prometheus)"""
+        return text_response(METRICS.render(), content_type=MetricsRegistry.CONTENT_TYPE)
+    
+    async def _ping_endpoint(self, request):
+        """Обработчик GET /ping"""
+        return text_response("pong")
 
 def start_flask_server():
     """Запускает простой Flask сервер для Render"""
+    from flask import Flask
+    
     app = Flask(__name__)
     
     @app.route('/')
@@ -381,6 +837,10 @@ def start_flask_server():
     def ping():
         return "pong", 200
     
+    @app.route('/metrics')
+    def metrics():
+        return METRICS.render(), 200, {'Content-Type': MetricsRegistry.CONTENT_TYPE}
+    
     port = int(os.getenv('PORT', 5000))
     app.run(host='0.0.0.0', port=port)
 
@@ -395,13 +855,19 @@ def main():
         print("TELEGRAM_BOT_TOKEN=ваш_токен_бота")
         return 1
     
-    # Создаем Flask сервер в отдельном потоке
-    flask_thread = Thread(target=start_flask_server, daemon=True)
-    flask_thread.start()
-    
-    # Создаем и запускаем бота
+    port = int(os.getenv('PORT', 5000))
     bot = PlatonTelegramBot(token)
-    bot.run()
+    
+    if BOT_MODE == 'webhook':
+        # Вебхук и служебные запросы обслуживает сам бот
+        bot.run_webhook(port)
+    else:
+        # Создаем Flask сервер в отдельном потоке
+        flask_thread = Thread(target=start_flask_server, daemon=True)
+        flask_thread.start()
+        
+        # Запускаем бота
+        bot.run()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
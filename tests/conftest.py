@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+"""Общие настройки тестов: модули проекта лежат в корне репозитория и в топливо/"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, 'топливо')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""Анализатор топлива: разбор листа ГЛОНАСС, сопоставление заправок и таблица расхода"""
+
+import itertools
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture(scope='module')
+def analyzer(tmp_path_factory):
+    """Модуль анализатора; при импорте он создает fuel_analysis.log в текущей папке"""
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('fuel'))
+    try:
+        import fuel_consumption_analyzer
+    finally:
+        os.chdir(cwd)
+    return fuel_consumption_analyzer
+
+
+def test_min_cost_assignment_matches_brute_force(analyzer):
+    rng = np.random.default_rng(7)
+    for _ in range(50):
+        n = int(rng.integers(1, 5))
+        m = int(rng.integers(n, 6))
+        cost = rng.uniform(-3, 3, size=(n, m))
+        columns = analyzer._min_cost_assignment(cost)
+
+        assert len(set(columns)) == n
+        best = min(
+            sum(cost[row, column] for row, column in enumerate(choice))
+            for choice in itertools.permutations(range(m), n)
+        )
+        assert cost[np.arange(n), columns].sum() == pytest.approx(best)
+
+
+def test_assign_refuels_prefers_more_pairs_over_cheaper_ones(analyzer):
+    # Самая дешевая пара (0, 10) оставила бы заправку 1 без пары
+    left = np.array([0, 0, 1])
+    right = np.array([10, 11, 10])
+    costs = np.array([0.1, 1.5, 1.5])
+    chosen_left, chosen_right = analyzer.assign_refuels(left, right, costs)
+
+    assert sorted(zip(chosen_left, chosen_right)) == [(0, 11), (1, 10)]
+
+
+def test_assign_refuels_uses_each_refuel_once(analyzer):
+    left = np.array([0, 1, 2, 3, 3])
+    right = np.array([10, 10, 12, 13, 14])
+    costs = np.array([0.5, 0.2, 0.0, 0.9, 0.1])
+    chosen_left, chosen_right = analyzer.assign_refuels(left, right, costs)
+
+    assert sorted(zip(chosen_left, chosen_right)) == [(1, 10), (2, 12), (3, 14)]
+
+
+def test_assign_refuels_skips_undefined_costs(analyzer):
+    left = np.array([0, 1, 1])
+    right = np.array([10, 10, 11])
+    costs = np.array([np.nan, 0.3, np.inf])
+    chosen_left, chosen_right = analyzer.assign_refuels(left, right, costs)
+
+    assert list(zip(chosen_left, chosen_right)) == [(1, 10)]
+
+
+def test_refuel_time_index_window_is_strict(analyzer):
+    start = datetime(2025, 10, 1, 12, 0)
+    index = analyzer.RefuelTimeIndex(
+        pd.Series(['А001АА', 'А001АА', 'В002ВВ', 'А001АА']),
+        pd.Series([start, start + timedelta(minutes=30), start, pd.NaT])
+    )
+    times = [start - timedelta(hours=1), start + timedelta(minutes=15), start + timedelta(hours=2)]
+
+    assert list(index.count_within('А001АА', times, timedelta(hours=1))) == [0, 2, 0]
+    assert list(index.has_within('В002ВВ', times, timedelta(hours=1))) == [False, True, False]
+    assert list(index.has_within('С003СС', times, timedelta(hours=1))) == [False, False, False]
+    assert len(index.vehicle_times('А001АА')) == 2
+
+
+def test_zero_liter_refuels_get_finite_costs(analyzer, monkeypatch):
+    start = datetime(2025, 10, 1, 12, 0)
+    fuel = analyzer.FuelConsumptionAnalyzer()
+    fuel.glonass_refuel_data = pd.DataFrame({
+        'datetime': [start + timedelta(minutes=10), start + timedelta(minutes=20), start + timedelta(hours=5)],
+        'vehicle_number': ['А001АА', 'А001АА', 'А001АА'],
+        'Заправлено': [0.0, 5.0, 50.0],
+    })
+    krassula = pd.DataFrame({
+        'datetime': [start, start + timedelta(hours=5, minutes=30)],
+        'vehicle_number': ['А001АА', 'А001АА'],
+        'liters': [0.0, 52.0],
+    })
+
+    seen_costs = []
+    assign_refuels = analyzer.assign_refuels
+
+    def recording_assign(left, right, costs):
+        seen_costs.append(costs)
+        return assign_refuels(left, right, costs)
+
+    monkeypatch.setattr(analyzer, 'assign_refuels', recording_assign)
+    positions = fuel._match_glonass_refuels(krassula)
+
+    assert list(positions) == [0, 2]
+    assert all(np.isfinite(costs).all() for costs in seen_costs)
+
+
+def test_glonass_refuel_sheet_is_parsed_by_vehicle_groups(analyzer):
+    sheet = pd.DataFrame({
+        'Группировка': [
+            # Дата до первого автомобиля не относится ни к какому автомобилю
+            '05.10.2025', 'Scania т497ес797', '01.10.2025', '02.10.2025', '03.10.2025',
+            'КАМАЗ 65115 А258АХ', '04.10.2025', '06.10.2025',
+        ],
+        'Время': ['10:00:00', '', '08:30:00', '-----', '03.10.2025 14:05:00', '', '09:00:00', '11:00:00'],
+        'Заправлено': [30, '', 120.5, 50, 80, '', '-----', 60],
+        'Пробег': [100, '', 1500, 1600, 1700, '', 2000, 2100],
+    })
+    refuels = analyzer.FuelConsumptionAnalyzer()._process_glonass_refuels(sheet)
+
+    assert refuels['vehicle_number'].to_list() == ['497', '497', '258']
+    assert refuels['date'].to_list() == ['2025-10-01', '2025-10-03', '2025-10-06']
+    assert refuels['datetime'].to_list() == [
+        pd.Timestamp('2025-10-01 08:30:00'), pd.Timestamp('2025-10-03 14:05:00'), pd.Timestamp('2025-10-06 11:00:00'),
+    ]
+    assert refuels['Заправлено'].to_list() == [120.5, 80, 60]
+
+
+def test_glonass_refuel_sheet_without_refuels(analyzer):
+    sheet = pd.DataFrame({
+        'Группировка': ['Scania т497ес797', '01.10.2025'],
+        'Время': ['', '-----'],
+        'Заправлено': ['', '-----'],
+        'Пробег': ['', '-----'],
+    })
+
+    assert analyzer.FuelConsumptionAnalyzer()._process_glonass_refuels(sheet).empty
+
+
+def matched(date, liters, odometer):
+    return {'date': date, 'krassula_liters': liters, 'odometer': odometer, 'difference': 0.0, 'status': 'matched'}
+
+
+def krassula_only(date, liters):
+    return {'date': date, 'krassula_liters': liters, 'odometer': None, 'difference': None, 'status': 'krassula_only'}
+
+
+def test_consumption_table_uses_previous_matched_refuel(analyzer):
+    fuel = analyzer.FuelConsumptionAnalyzer()
+    fuel.results = {
+        # Заправки не по порядку дат, между сопоставленными — заправка только в Крассуле
+        '497': [
+            matched(datetime(2025, 10, 3), 60.0, 1300),
+            matched(datetime(2025, 10, 1), 50.0, 1000),
+            krassula_only(datetime(2025, 10, 2), 40.0),
+            matched(datetime(2025, 10, 4), 10.0, 1300),
+            matched(datetime(2025, 10, 5), 20.0, 1200),
+        ],
+        '258': [matched(datetime(2025, 10, 1), 30.0, 500)],
+    }
+    table = fuel._build_consumption_table().set_index(['vehicle_number', 'position'])
+
+    assert table.loc[('497', 0), 'prev_odometer'] == 1000
+    assert table.loc[('497', 0), 'distance'] == 300
+    assert table.loc[('497', 0), 'consumption'] == 20.0
+    # Первая заправка автомобиля и заправка только в Крассуле без пробега
+    for key in [('497', 1), ('497', 2), ('258', 0)]:
+        assert pd.isna(table.loc[key, 'distance'])
+        assert pd.isna(table.loc[key, 'consumption'])
+    assert not table.loc[('497', 2), 'matched']
+    # Нулевой и отрицательный пробег: расход не считается
+    assert table.loc[('497', 3), 'distance'] == 0
+    assert table.loc[('497', 4), 'distance'] == -100
+    assert pd.isna(table.loc[('497', 3), 'consumption'])
+    assert pd.isna(table.loc[('497', 4), 'consumption'])
+
+
+def test_match_refuels_writes_distance_and_consumption_back(analyzer):
+    fuel = analyzer.FuelConsumptionAnalyzer()
+    fuel.card_to_vehicle_mapping = {'1234': '497'}
+    fuel.krassula_data = pd.DataFrame({
+        'Номер карты': ['7000001234'] * 4,
+        'Дата и время': [
+            datetime(2025, 10, 3, 8), datetime(2025, 10, 1, 8), datetime(2025, 10, 2, 8), datetime(2025, 10, 4, 8),
+        ],
+        'Кол-во литров': [60.0, 50.0, 40.0, 10.0],
+        'Цена со скидкой': [60.0] * 4,
+        'Сумма со скидкой': [600.0] * 4,
+        'АЗС': ['АЗС 1'] * 4,
+    })
+    fuel.glonass_refuel_data = pd.DataFrame({
+        'vehicle_number': ['497'] * 3,
+        'datetime': [datetime(2025, 10, 1, 8, 10), datetime(2025, 10, 3, 8, 20), datetime(2025, 10, 4, 8, 5)],
+        'Заправлено': [50.0, 61.0, 10.0],
+        'Пробег': [1000, 1300, 1300],
+    })
+    results = fuel.match_refuels()['497']
+
+    assert [result['status'] for result in results] == ['matched', 'matched', 'krassula_only', 'matched']
+    assert (results[0]['probeg'], results[0]['consumption']) == (300, 20.0)
+    # Первая сопоставленная заправка сохраняет начальные нули
+    assert (results[1]['probeg'], results[1]['consumption']) == (0, 0)
+    assert 'probeg' not in results[2]
+    # Нулевой пробег: расход 0
+    assert (results[3]['probeg'], results[3]['consumption']) == (0, 0)
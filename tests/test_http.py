@@ -0,0 +1,169 @@
+"""HTTP сервер вебхука: маршруты, ошибки, keep-alive и проверка секрета Telegram"""
+
+import asyncio
+import json
+
+import pytest
+
+import telegram_bot
+from platon_http import HttpServer, HttpRequest, text_response
+
+
+async def hello(request):
+    return text_response(f"hello {len(request.body)}")
+
+
+async def start_server(**options):
+    server = HttpServer(**options)
+    server.route('GET', '/hello', hello)
+    server.route('POST', '/hello', hello)
+    sockets = (await server.start('127.0.0.1', 0)).sockets
+    return server, sockets[0].getsockname()[1]
+
+
+async def read_response(reader):
+    """Статус, заголовки и тело одного ответа"""
+    status_line = await reader.readline()
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', 0))
+    return int(status_line.split()[1]), headers, await reader.readexactly(length)
+
+
+def exchange(requests, expect_close=False, **options):
+    """Отправляет запросы в одно соединение и возвращает ответы
+
+    Проверяет, что сервер не оставил необработанных исключений.
+    """
+    async def scenario():
+        errors = []
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: errors.append(context))
+        server, port = await start_server(**options)
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            responses = []
+            for request in requests:
+                writer.write(request)
+                responses.append(await read_response(reader))
+            if expect_close:
+                assert await asyncio.wait_for(reader.read(), timeout=5) == b''
+            writer.close()
+            return responses
+        finally:
+            await server.close()
+            await asyncio.sleep(0)
+            assert errors == []
+
+    return asyncio.run(scenario())
+
+
+def test_routes_and_missing_paths():
+    responses = exchange([
+        b'GET /hello?x=1 HTTP/1.1\r\nHost: t\r\n\r\n',
+        b'GET /missing HTTP/1.1\r\nHost: t\r\n\r\n',
+        b'DELETE /hello HTTP/1.1\r\nHost: t\r\n\r\n',
+        b'POST /hello HTTP/1.1\r\nContent-Length: 3\r\n\r\nabc',
+    ])
+    assert [(status, body) for status, _, body in responses] == [
+        (200, b'hello 0'), (404, b'Not Found'), (405, b'Method Not Allowed'), (200, b'hello 3'),
+    ]
+
+
+def test_head_returns_headers_without_body():
+    async def scenario():
+        server, port = await start_server()
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b'HEAD /hello HTTP/1.1\r\nConnection: close\r\n\r\n')
+            data = await asyncio.wait_for(reader.read(), timeout=5)
+            writer.close()
+            return data
+        finally:
+            await server.close()
+
+    head, _, body = asyncio.run(scenario()).partition(b'\r\n\r\n')
+    assert head.startswith(b'HTTP/1.1 200 ')
+    assert b'Content-Length: 7' in head
+    assert body == b''
+
+
+def test_too_large_body_is_rejected():
+    (status, headers, _), = exchange(
+        [b'POST /hello HTTP/1.1\r\nContent-Length: 100\r\n\r\n'], expect_close=True, max_body=10
+    )
+    assert status == 413
+    assert headers['connection'] == 'close'
+
+
+def test_too_long_header_is_rejected():
+    request = b'GET /hello HTTP/1.1\r\nX-Long: ' + b'a' * (70 * 1024) + b'\r\n\r\n'
+    (status, headers, _), = exchange([request], expect_close=True)
+    assert status == 431
+    assert headers['connection'] == 'close'
+
+
+def test_http11_keeps_connection_until_close_requested():
+    responses = exchange([
+        b'GET /hello HTTP/1.1\r\nHost: t\r\n\r\n',
+        b'GET /hello HTTP/1.1\r\nConnection: close\r\n\r\n',
+    ], expect_close=True)
+    assert [headers['connection'] for _, headers, _ in responses] == ['keep-alive', 'close']
+
+
+def test_http10_closes_unless_keep_alive_requested():
+    (_, headers, _), = exchange([b'GET /hello HTTP/1.0\r\n\r\n'], expect_close=True)
+    assert headers['connection'] == 'close'
+
+    responses = exchange([
+        b'GET /hello HTTP/1.0\r\nConnection: keep-alive\r\n\r\n',
+        b'GET /hello HTTP/1.0\r\n\r\n',
+    ], expect_close=True)
+    assert [headers['connection'] for _, headers, _ in responses] == ['keep-alive', 'close']
+
+
+@pytest.fixture(scope='module')
+def bot():
+    bot = telegram_bot.PlatonTelegramBot('123:test')
+    yield bot
+    bot.executor.shutdown()
+
+
+def webhook_request(body, secret=None):
+    headers = {'x-telegram-bot-api-secret-token': secret} if secret is not None else {}
+    return HttpRequest('POST', telegram_bot.WEBHOOK_PATH, 'HTTP/1.1', headers, body)
+
+
+UPDATE = json.dumps({'update_id': 1}).encode()
+
+
+def test_webhook_checks_secret_token(bot, monkeypatch):
+    monkeypatch.setattr(telegram_bot, 'WEBHOOK_SECRET', 's3cret')
+
+    async def scenario():
+        results = [
+            await bot._webhook_endpoint(webhook_request(UPDATE)),
+            await bot._webhook_endpoint(webhook_request(UPDATE, 'wrong')),
+            await bot._webhook_endpoint(webhook_request(UPDATE, 's3cret')),
+            await bot._webhook_endpoint(webhook_request(b'not json', 's3cret')),
+        ]
+        queued = bot.application.update_queue.get_nowait()
+        return [status for status, _, _ in results], queued
+
+    statuses, queued = asyncio.run(scenario())
+    assert statuses == [403, 403, 200, 400]
+    assert queued.update_id == 1
+
+
+def test_webhook_without_secret_accepts_updates(bot, monkeypatch):
+    monkeypatch.setattr(telegram_bot, 'WEBHOOK_SECRET', '')
+
+    async def scenario():
+        status, _, _ = await bot._webhook_endpoint(webhook_request(UPDATE))
+        return status, bot.application.update_queue.qsize()
+
+    assert asyncio.run(scenario()) == (200, 1)
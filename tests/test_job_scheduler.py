@@ -0,0 +1,149 @@
+"""Очередь задач /process: запуск ожидающих задач при освобождении мест"""
+
+import asyncio
+
+from telegram.error import TimedOut
+
+from telegram_bot import JobScheduler, PlatonTelegramBot
+
+
+def test_queue_drains_with_more_users_than_slots():
+    async def scenario():
+        jobs = JobScheduler(max_active=2, max_queued=10)
+        assert [jobs.enqueue(user) for user in 'ABCDE'] == [0, 0, 1, 2, 3]
+
+        started = []
+
+        async def job(user):
+            await jobs.wait_turn(user)
+            started.append(user)
+            await asyncio.sleep(0.01)
+            await jobs.finish(user)
+
+        await asyncio.wait_for(asyncio.gather(*(job(user) for user in 'ABCDE')), timeout=5)
+        assert started[:2] == ['A', 'B'] or started[:2] == ['B', 'A']
+        assert started[2:] == ['C', 'D', 'E']
+        assert jobs.active == set()
+        assert jobs.waiting == []
+
+    asyncio.run(scenario())
+
+
+def test_finish_promotes_waiters_in_order():
+    async def scenario():
+        jobs = JobScheduler(max_active=2, max_queued=10)
+        for user in 'ABCD':
+            jobs.enqueue(user)
+        assert jobs.active == {'A', 'B'}
+
+        await jobs.finish('A')
+        assert jobs.active == {'B', 'C'}
+        assert jobs.waiting == ['D']
+
+        await jobs.finish('C')
+        assert jobs.active == {'B', 'D'}
+        assert jobs.waiting == []
+
+    asyncio.run(scenario())
+
+
+def test_waiters_see_their_positions():
+    async def scenario():
+        jobs = JobScheduler(max_active=1, max_queued=10)
+        for user in 'ABC':
+            jobs.enqueue(user)
+        positions = []
+
+        async def report(position):
+            positions.append(position)
+
+        waiter = asyncio.create_task(jobs.wait_turn('C', report))
+        await asyncio.sleep(0)
+        await jobs.finish('A')
+        await asyncio.sleep(0)
+        await jobs.finish('B')
+        await asyncio.wait_for(waiter, timeout=5)
+        assert positions == [1]
+        assert jobs.position('C') == 0
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_leaves_queue():
+    async def scenario():
+        jobs = JobScheduler(max_active=1, max_queued=10)
+        for user in 'ABC':
+            jobs.enqueue(user)
+        waiter = asyncio.create_task(jobs.wait_turn('B'))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert jobs.waiting == ['C']
+
+        await jobs.finish('A')
+        assert jobs.active == {'C'}
+
+    asyncio.run(scenario())
+
+
+def test_slow_position_report_does_not_block_finish():
+    async def scenario():
+        jobs = JobScheduler(max_active=1, max_queued=10)
+        for user in 'ABC':
+            jobs.enqueue(user)
+        reporting = asyncio.Event()
+        release = asyncio.Event()
+
+        async def slow_report(position):
+            reporting.set()
+            await release.wait()
+
+        waiter = asyncio.create_task(jobs.wait_turn('C', slow_report))
+        await asyncio.sleep(0)
+        await jobs.finish('A')
+        await asyncio.wait_for(reporting.wait(), timeout=5)
+        # Пока C сообщает позицию, очередь продолжает двигаться
+        await asyncio.wait_for(jobs.finish('B'), timeout=1)
+        assert jobs.active == {'C'}
+
+        release.set()
+        await asyncio.wait_for(waiter, timeout=5)
+
+    asyncio.run(scenario())
+
+
+def test_failed_position_report_keeps_job_queued():
+    async def scenario():
+        jobs = JobScheduler(max_active=1, max_queued=10)
+        for user in 'ABC':
+            jobs.enqueue(user)
+
+        async def failing_report(position):
+            raise TimedOut()
+
+        waiter = asyncio.create_task(jobs.wait_turn('C', failing_report))
+        await asyncio.sleep(0)
+        await jobs.finish('A')
+        await asyncio.sleep(0)
+        assert jobs.waiting == ['C']
+
+        await jobs.finish('B')
+        await asyncio.wait_for(waiter, timeout=5)
+        assert jobs.active == {'C'}
+
+    asyncio.run(scenario())
+
+
+def test_status_edit_errors_are_logged_not_raised():
+    class Message:
+        async def edit_text(self, text):
+            raise TimedOut()
+
+    asyncio.run(PlatonTelegramBot._edit_status(None, Message(), "🕒 Отчет в очереди, позиция: 1."))
+
+
+def test_full_queue_rejects_new_jobs():
+    jobs = JobScheduler(max_active=1, max_queued=1)
+    assert jobs.enqueue('A') == 0
+    assert jobs.enqueue('B') == 1
+    assert jobs.enqueue('C') is None
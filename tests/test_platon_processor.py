@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""Одинаковые отчеты PlatonProcessor во всех режимах чтения выписок"""
+
+import io
+import os
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook, load_workbook
+
+import platon_processor
+from platon_processor import PlatonProcessor, read_statement_part, spill_statement_part, render_parts
+from platon_store import PlatonStore
+
+
+HEADER = (
+    'Дата/время операции (мск);Уникальный номер операции;Тип операции;ГРЗ ТС;'
+    'Путь по фед. дорогам, км;Наименование дороги;Зачисление на РЗ (руб.);'
+    'Списание с РЗ (руб.);Номер БУ/МК'
+)
+
+ROWS = [
+    '01.10.2025 00:06:52;101;Начисление Платы (БУ);Т701УН797;38,768;М5;;129,50;№ 1',
+    '01.10.2025 10:00:00;102;Начисление Платы (БУ);А258АХ797;140,760;М7;;470,17;№ 2',
+    # Дата без времени
+    '02.10.2025;103;Начисление Платы (БУ);Т701УН797;10,000;М5;;33,40;№ 1',
+    '03.10.2025 08:15:00;104;Начисление Платы (БУ);А258АХ797;0,391;А108;;1,31;№ 2',
+]
+
+
+def statement(rows=ROWS, bom=True):
+    """Содержимое выписки в байтах"""
+    text = '\n'.join([HEADER] + list(rows)) + '\n'
+    return (b'\xef\xbb\xbf' if bom else b'') + text.encode('utf-8')
+
+
+MODES = [
+    ('eager', 'path'), ('eager', 'bytes'),
+    ('streaming', 'path'), ('streaming', 'bytes'),
+    ('store', 'path'), ('store-streaming', 'bytes'),
+]
+
+
+def build_summary(tmp_path, sources, mode, kind):
+    """Читает выписки в заданном режиме и возвращает сводку"""
+    inputs = []
+    for i, content in enumerate(sources):
+        if kind == 'bytes':
+            inputs.append(content)
+        else:
+            path = tmp_path / f"statement_{i}.csv"
+            path.write_bytes(content)
+            inputs.append(str(path))
+
+    store = PlatonStore(str(tmp_path / 'store.sqlite3')) if mode.startswith('store') else None
+    try:
+        processor = PlatonProcessor(streaming=mode in ('streaming', 'store-streaming'), store=store)
+        assert all(processor.read_csv_files(inputs))
+        processor.process_data()
+        return processor.summary
+    finally:
+        if store is not None:
+            store.close()
+
+
+def comparable(summary):
+    """Части сводки, которые должны совпадать во всех режимах"""
+    return {
+        'total_records': summary['total_records'],
+        'total_amount': round(summary['total_amount'], 2),
+        'total_distance': round(summary['total_distance'], 3),
+        'by_vehicle': summary['by_vehicle'],
+        'by_road': summary['by_road'],
+        'by_date': summary['by_date'],
+        'duplicates_skipped': summary['duplicates_skipped'],
+    }
+
+
+@pytest.mark.parametrize('mode, kind', MODES)
+def test_report_matches_eager_mode(tmp_path, mode, kind):
+    eager_dir = tmp_path / 'eager'
+    eager_dir.mkdir()
+    expected = build_summary(eager_dir, [statement()], 'eager', 'path')
+    mode_dir = tmp_path / 'mode'
+    mode_dir.mkdir()
+    actual = build_summary(mode_dir, [statement()], mode, kind)
+
+    assert comparable(actual) == comparable(expected)
+    pd.testing.assert_frame_equal(actual['daily_matrix'], expected['daily_matrix'], check_dtype=False)
+
+
+@pytest.mark.parametrize('mode, kind', MODES)
+def test_date_only_timestamps_are_kept(tmp_path, mode, kind):
+    summary = build_summary(tmp_path, [statement()], mode, kind)
+
+    assert sorted(summary['by_date']) == ['2025-10-01', '2025-10-02', '2025-10-03']
+    assert summary['by_date']['2025-10-02']['count'] == 1
+
+
+def test_statement_part_in_worker_matches_direct_read(tmp_path):
+    path = tmp_path / 'statement.csv'
+    path.write_bytes(statement())
+    part = read_statement_part(str(path), False)
+    processor = PlatonProcessor()
+    assert processor.merge_part(str(path), part)
+    processor.process_data()
+
+    assert comparable(processor.summary) == comparable(build_summary(tmp_path, [statement()], 'eager', 'bytes'))
+
+
+OVERLAP_ROWS = [
+    '03.10.2025 08:15:00;104;Начисление Платы (БУ);А258АХ797;0,391;А108;;1,31;№ 2',
+    '04.10.2025 09:00:00;105;Начисление Платы (БУ);Т701УН797;5,000;М5;;16,70;№ 1',
+]
+
+
+@pytest.mark.parametrize('mode', ['eager', 'streaming', 'store', 'store-streaming'])
+def test_overlapping_statements_count_duplicates_once(tmp_path, mode):
+    summary = build_summary(tmp_path, [statement(), statement(OVERLAP_ROWS)], mode, 'path')
+
+    assert summary['total_records'] == 5
+    assert summary['duplicates_skipped'] == 1
+    assert summary.get('already_stored', 0) == 0
+
+
+@pytest.mark.parametrize('streaming', [False, True])
+def test_store_reports_earlier_loads_separately(tmp_path, streaming):
+    mode = 'store-streaming' if streaming else 'store'
+    first = build_summary(tmp_path, [statement()], mode, 'path')
+    again = build_summary(tmp_path, [statement()], mode, 'path')
+
+    assert first['already_stored'] == 0
+    assert again['total_records'] == len(ROWS)
+    assert again['duplicates_skipped'] == 0
+    assert again['already_stored'] == len(ROWS)
+
+
+@pytest.mark.parametrize('streaming', [False, True])
+def test_spilled_parts_match_reading_in_order(tmp_path, streaming):
+    sources = [statement(), statement(OVERLAP_ROWS)]
+    parts = [spill_statement_part(source, streaming) for source in sources]
+    try:
+        # Выписка без части читается заново
+        summary, report = render_parts(
+            [(sources[0], parts[0]), (sources[1], None)], streaming
+        )
+    finally:
+        for part_path in parts:
+            os.remove(part_path)
+    expected = build_summary(tmp_path, sources, 'streaming' if streaming else 'eager', 'bytes')
+
+    assert comparable(summary) == comparable(expected)
+    assert report.startswith(b'PK')
+
+
+MULTILINE_ROWS = [
+    '01.10.2025 00:06:52;101;Начисление Платы (БУ);Т701УН797;38,768;"Развязка\nфедеральных дорог";;129,50;№ 1',
+    '01.10.2025 10:00:00;102;Начисление Платы (БУ);А258АХ797;140,760;"М7 ""Волга""";;470,17;№ 2',
+    '02.10.2025 11:00:00;103;Начисление Платы (БУ);Т701УН797;10,000;М5;;33,40;№ 1',
+]
+
+
+@pytest.mark.parametrize('mode, kind', MODES)
+def test_quoted_fields_with_newlines(tmp_path, mode, kind):
+    summary = build_summary(tmp_path, [statement(MULTILINE_ROWS)], mode, kind)
+
+    assert summary['total_records'] == 3
+    assert sorted(summary['by_road']) == sorted(['Развязка\nфедеральных дорог', 'М7 "Волга"', 'М5'])
+    assert round(summary['total_amount'], 2) == 633.07
+
+
+def test_long_sheets_continue_with_repeated_header(monkeypatch):
+    monkeypatch.setattr(platon_processor, 'EXCEL_MAX_ROWS', 3)
+    workbook = Workbook()
+    PlatonProcessor()._write_rows(workbook, 'Строки', ['a', 'b'], ((i, i * 10) for i in range(5)))
+
+    sheets = {sheet.title: list(sheet.values) for sheet in workbook.worksheets[1:]}
+    assert sheets == {
+        'Строки': [('a', 'b'), (0, 0), (1, 10)],
+        'Строки (2)': [('a', 'b'), (2, 20), (3, 30)],
+        'Строки (3)': [('a', 'b'), (4, 40)],
+    }
+
+
+def test_details_sheet_is_split_in_report(monkeypatch):
+    monkeypatch.setattr(platon_processor, 'EXCEL_MAX_ROWS', 3)
+    processor = PlatonProcessor()
+    assert processor.read_csv_file(statement())
+    _, report = platon_processor.render_report(processor)
+
+    workbook = load_workbook(io.BytesIO(report))
+    details = [workbook[name] for name in workbook.sheetnames if name.startswith('Детальные данные')]
+    assert [sheet.title for sheet in details] == ['Детальные данные', 'Детальные данные (2)']
+    headers = [next(sheet.values) for sheet in details]
+    assert headers[0] == headers[1]
+    assert sum(sheet.max_row - 1 for sheet in details) == len(ROWS)
@@ -0,0 +1,123 @@
+"""Хранилища сводок и загруженных выписок: время жизни и ограничения"""
+
+import os
+
+import pytest
+
+import platon_sessions
+from platon_sessions import SessionStore, UploadStore, UploadLimitError
+
+
+class Clock:
+    """Управляемое время вместо time.time"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(platon_sessions.time, 'time', clock)
+    return clock
+
+
+def test_session_expires_after_ttl(clock):
+    store = SessionStore(ttl=60, max_bytes=10_000)
+    store.put(1, {'total_records': 3})
+    clock.now += 59
+    assert store.get(1) == {'total_records': 3}
+    clock.now += 1
+    assert store.get(1) is None
+
+
+def test_evicted_sessions_spill_to_disk_and_come_back(clock, tmp_path):
+    store = SessionStore(ttl=60, max_bytes=200, spill_dir=str(tmp_path))
+    store.put(1, 'a' * 150)
+    store.put(2, 'b' * 150)
+    assert list(store.entries) == [2]
+    assert (tmp_path / '1.pickle').exists()
+
+    assert store.get(1) == 'a' * 150
+    assert not (tmp_path / '1.pickle').exists()
+    assert (tmp_path / '2.pickle').exists()
+
+
+def test_purge_uses_file_time_without_unpickling(clock, tmp_path, monkeypatch):
+    store = SessionStore(ttl=60, max_bytes=200, spill_dir=str(tmp_path))
+    store.put(1, 'a' * 150)
+    clock.now += 30
+    store.put(2, 'b' * 150)
+    store.put(3, 'c' * 150)
+    assert sorted(os.listdir(tmp_path)) == ['1.pickle', '2.pickle']
+
+    def fail_load(file):
+        raise AssertionError("put не должен читать вытесненные записи")
+
+    clock.now += 40
+    with monkeypatch.context() as patch:
+        patch.setattr(platon_sessions.pickle, 'load', fail_load)
+        store.put(4, 'd' * 10)
+    # Запись 1 сохранена 70 секунд назад и устарела, запись 2 — 40 секунд назад
+    assert sorted(os.listdir(tmp_path)) == ['2.pickle']
+    assert store.get(2) == 'b' * 150
+    assert store.get(1) is None
+
+
+def test_uploads_are_limited_by_count_and_bytes(clock):
+    released = []
+    store = UploadStore(ttl=60, max_files=2, max_bytes=100, release=released.append)
+    store.add(1, 'a', 40)
+    with pytest.raises(UploadLimitError):
+        store.check(1, 70)
+    with pytest.raises(UploadLimitError):
+        store.add(1, 'big', 70)
+    assert released == ['big']
+
+    store.add(1, 'b', 50)
+    with pytest.raises(UploadLimitError):
+        store.check(1, 1)
+    # Ограничения у каждого пользователя свои
+    store.add(2, 'c', 90)
+    assert store.get(1) == ['a', 'b']
+    assert store.get(2) == ['c']
+
+
+def test_uploads_expire_after_last_upload(clock):
+    released = []
+    store = UploadStore(ttl=60, max_files=10, max_bytes=1000, release=released.append)
+    store.add(1, 'a', 10)
+    store.add(2, 'b', 10)
+    clock.now += 50
+    store.add(1, 'c', 10)
+
+    clock.now += 20
+    assert store.get(1) == ['a', 'c']
+    # Выписки брошенного пользователя удаляются при обращении других
+    assert released == ['b']
+    assert 2 not in store.entries
+
+    clock.now += 60
+    assert store.get(1) == []
+    assert released == ['b', 'a', 'c']
+
+
+def test_remove_keeps_uploads_added_later(clock):
+    released = []
+    store = UploadStore(ttl=60, max_files=10, max_bytes=1000, release=released.append)
+    first, second = bytes(b'same'), bytearray(b'same')
+    store.add(1, first, 4)
+    job = store.get(1)
+    store.add(1, second, 4)
+
+    store.remove(1, job)
+    assert released == [first]
+    assert store.get(1) == [second]
+    assert store.get(1)[0] is second
+
+    store.clear(1)
+    assert store.get(1) == []
+    assert 1 not in store.entries
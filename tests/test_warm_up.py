@@ -0,0 +1,27 @@
+"""Прогрев бота: модуль обработки загружается только в процессах пула"""
+
+import subprocess
+import sys
+
+from conftest import ROOT
+
+
+WARM_UP_SCRIPT = '''
+import asyncio, sys
+import telegram_bot
+
+bot = telegram_bot.PlatonTelegramBot('123:test')
+asyncio.run(bot.warm_up())
+bot.executor.shutdown()
+print(sorted(name for name in ('platon_processor', 'pandas', 'openpyxl') if name in sys.modules))
+'''
+
+
+def test_warm_up_keeps_processing_modules_out_of_bot_process():
+    result = subprocess.run(
+        [sys.executable, '-c', WARM_UP_SCRIPT], cwd=ROOT,
+        capture_output=True, text=True, timeout=120
+    )
+    assert result.returncode == 0, result.stderr
+    assert 'Прогрев завершен' in result.stderr
+    assert result.stdout.strip().splitlines()[-1] == '[]'
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Компактное представление операций системы "Платон" для упрощенной программы
+Часть platon_records.py основной программы без потокового чтения байтов:
+папка платон/ работает отдельно от остального репозитория
+"""
+
+import sys
+from datetime import datetime
+
+
+# Колонки выписки Платон
+COL_TIMESTAMP = 'Дата/время операции (мск)'
+COL_OPERATION_ID = 'Уникальный номер операции'
+COL_OPERATION_TYPE = 'Тип операции'
+COL_VEHICLE = 'ГРЗ ТС'
+COL_DISTANCE = 'Путь по фед. дорогам, км'
+COL_ROAD = 'Наименование дороги'
+COL_AMOUNT = 'Списание с РЗ (руб.)'
+COL_DEVICE = 'Номер БУ/МК'
+
+TIMESTAMP_FORMAT = '%d.%m.%Y %H:%M:%S'
+
+
+class PlatonOperation:
+    """Операция из выписки Платон
+
+    Сумма хранится в копейках, расстояние в метрах, номер операции —
+    целым числом (0, если номера нет). Тип операции, ГРЗ, дорога и номер
+    БУ интернируются: повторяющиеся значения занимают память один раз.
+    """
+
+    __slots__ = (
+        'timestamp', 'operation_id', 'operation_type', 'vehicle',
+        'road', 'device', 'kopecks', 'meters'
+    )
+
+    def __init__(self, timestamp, operation_id, operation_type, vehicle, road, device, kopecks, meters):
+        self.timestamp = timestamp
+        self.operation_id = operation_id
+        self.operation_type = sys.intern(operation_type)
+        self.vehicle = sys.intern(vehicle)
+        self.road = sys.intern(road)
+        self.device = sys.intern(device)
+        self.kopecks = kopecks
+        self.meters = meters
+
+    @classmethod
+    def from_record(cls, record):
+        """Создает операцию из строки выписки (словарь колонка -> значение)"""
+        return cls(
+            timestamp=parse_timestamp(record.get(COL_TIMESTAMP, '')),
+            operation_id=parse_int(record.get(COL_OPERATION_ID, '')),
+            operation_type=record.get(COL_OPERATION_TYPE, ''),
+            vehicle=record.get(COL_VEHICLE, ''),
+            road=record.get(COL_ROAD, ''),
+            device=record.get(COL_DEVICE, ''),
+            kopecks=parse_scaled(record.get(COL_AMOUNT, '0'), 100),
+            meters=parse_scaled(record.get(COL_DISTANCE, '0'), 1000)
+        )
+
+    @property
+    def amount(self):
+        """Сумма списания в рублях"""
+        return self.kopecks / 100
+
+    @property
+    def distance(self):
+        """Путь по федеральным дорогам в километрах"""
+        return self.meters / 1000
+
+    def __repr__(self):
+        return (
+            f"PlatonOperation({self.timestamp!r}, {self.operation_id}, {self.vehicle!r}, "
+            f"{self.road!r}, {self.kopecks} коп., {self.meters} м)"
+        )
+
+
+def parse_scaled(value, scale):
+    """Парсит число с десятичной запятой в целое число мелких единиц (копеек, метров)"""
+    try:
+        return round(float(value.replace(',', '.')) * scale)
+    except (AttributeError, ValueError):
+        return 0
+
+
+def parse_int(value):
+    """Парсит целое число, 0 если значение пустое или некорректное"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def parse_timestamp(value):
+    """Парсит дату/время операции, None если дата некорректна"""
+    value = (value or '').strip()
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, TIMESTAMP_FORMAT)
+    except ValueError:
+        pass
+    try:
+        return datetime.strptime(value.split()[0], '%d.%m.%Y')
+    except ValueError:
+        return None
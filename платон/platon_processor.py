@@ -32,7 +32,8 @@ class PlatonProcessor:
         print(f"Читаю файл: {file_path}")
         
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
+            # utf-8-sig убирает BOM из заголовка первой колонки
+            with open(file_path, 'r', encoding='utf-8-sig') as file:
                 # Определяем разделитель
                 sample = file.read(1024)
                 file.seek(0)
@@ -270,8 +271,7 @@ class PlatonProcessor:
             vehicle = record.get('ГРЗ ТС', '')
             if not vehicle:
                 continue
-            # Обрабатываем BOM в названии колонки
-            date_str = record.get('Дата/время операции (мск)', '') or record.get('\ufeffДата/время операции (мск)', '')
+            date_str = record.get('Дата/время операции (мск)', '')
             amount = self._parse_float(record.get('Списание с РЗ (руб.)', '0'))
             
             if amount == 0:
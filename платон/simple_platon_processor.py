@@ -8,9 +8,9 @@
 import csv
 import os
 import sys
-from datetime import datetime
 from collections import defaultdict
 import json
+from platon_operation import PlatonOperation
 
 class SimplePlatonProcessor:
     """Упрощенный класс для обработки данных системы Платон"""
@@ -24,7 +24,8 @@ class SimplePlatonProcessor:
         print(f"Читаю файл: {file_path}")
         
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
+            # utf-8-sig убирает BOM из заголовка первой колонки
+            with open(file_path, 'r', encoding='utf-8-sig') as file:
                 # Определяем разделитель
                 sample = file.read(1024)
                 file.seek(0)
@@ -37,9 +38,9 @@ class SimplePlatonProcessor:
                 reader = csv.DictReader(file, delimiter=delimiter)
                 
                 for row in reader:
-                    # Очищаем данные от лишних пробелов
+                    # Очищаем данные от лишних пробелов и сохраняем компактную операцию
                     cleaned_row = {key.strip(): value.strip() for key, value in row.items()}
-                    self.data.append(cleaned_row)
+                    self.data.append(PlatonOperation.from_record(cleaned_row))
                     
             print(f"Прочитано {len(self.data)} записей")
             return True
@@ -58,32 +59,23 @@ class SimplePlatonProcessor:
         by_date = defaultdict(list)
         by_operation_type = defaultdict(list)
         
-        total_amount = 0
-        total_distance = 0
+        total_kopecks = 0
+        total_meters = 0
         
         for record in self.data:
-            # Извлекаем основные данные
-            vehicle = record.get('ГРЗ ТС', '')
-            road = record.get('Наименование дороги', '')
-            operation_type = record.get('Тип операции', '')
-            distance = self._parse_float(record.get('Путь по фед. дорогам, км', '0'))
-            amount = self._parse_float(record.get('Списание с РЗ (руб.)', '0'))
-            date_str = record.get('Дата/время операции (мск)', '')
-            
             # Группируем данные
-            by_vehicle[vehicle].append(record)
-            by_road[road].append(record)
-            by_operation_type[operation_type].append(record)
+            by_vehicle[record.vehicle].append(record)
+            by_road[record.road].append(record)
+            by_operation_type[record.operation_type].append(record)
             
-            # Парсим дату
-            try:
-                date_obj = datetime.strptime(date_str.split()[0], '%d.%m.%Y')
-                by_date[date_obj.strftime('%Y-%m-%d')].append(record)
-            except:
-                pass
+            if record.timestamp is not None:
+                by_date[record.timestamp.strftime('%Y-%m-%d')].append(record)
             
-            total_amount += amount
-            total_distance += distance
+            total_kopecks += record.kopecks
+            total_meters += record.meters
+        
+        total_amount = total_kopecks / 100
+        total_distance = total_meters / 1000
         
         # Создаем сводку
         self.summary = {
@@ -105,14 +97,6 @@ class SimplePlatonProcessor:
         print(f"Транспортных средств: {len(by_vehicle)}")
         print(f"Дорог: {len(by_road)}")
         
-    def _parse_float(self, value):
-        """Парсит строку в число с плавающей точкой"""
-        try:
-            # Заменяем запятую на точку для корректного парсинга
-            return float(value.replace(',', '.'))
-        except:
-            return 0.0
-    
     def create_html_report(self, output_file):
         """Создает HTML отчет"""
         print(f"Создаю HTML отчет: {output_file}")
@@ -191,8 +175,8 @@ class SimplePlatonProcessor:
         vehicle_data = []
         
         for vehicle, records in self.summary['by_vehicle'].items():
-            total_amount = sum(self._parse_float(r.get('Списание с РЗ (руб.)', '0')) for r in records)
-            total_distance = sum(self._parse_float(r.get('Путь по фед. дорогам, км', '0')) for r in records)
+            total_amount = sum(r.kopecks for r in records) / 100
+            total_distance = sum(r.meters for r in records) / 1000
             trips_count = len(records)
             
             vehicle_data.append({
@@ -236,8 +220,8 @@ class SimplePlatonProcessor:
         road_data = []
         
         for road, records in self.summary['by_road'].items():
-            total_amount = sum(self._parse_float(r.get('Списание с РЗ (руб.)', '0')) for r in records)
-            total_distance = sum(self._parse_float(r.get('Путь по фед. дорогам, км', '0')) for r in records)
+            total_amount = sum(r.kopecks for r in records) / 100
+            total_distance = sum(r.meters for r in records) / 1000
             trips_count = len(records)
             
             road_data.append({
@@ -281,8 +265,8 @@ class SimplePlatonProcessor:
         date_data = []
         
         for date, records in self.summary['by_date'].items():
-            total_amount = sum(self._parse_float(r.get('Списание с РЗ (руб.)', '0')) for r in records)
-            total_distance = sum(self._parse_float(r.get('Путь по фед. дорогам, км', '0')) for r in records)
+            total_amount = sum(r.kopecks for r in records) / 100
+            total_distance = sum(r.meters for r in records) / 1000
             trips_count = len(records)
             
             date_data.append({
@@ -335,13 +319,13 @@ class SimplePlatonProcessor:
         
         # Показываем только первые 100 записей
         for record in self.data[:100]:
-            date = record.get('Дата/время операции (мск)', '')
-            vehicle = record.get('ГРЗ ТС', '')
-            operation_type = record.get('Тип операции', '')
-            road = record.get('Наименование дороги', '')
-            distance = record.get('Путь по фед. дорогам, км', '0')
-            amount = record.get('Списание с РЗ (руб.)', '0')
-            bu_number = record.get('Номер БУ/МК', '')
+            date = record.timestamp.strftime('%d.%m.%Y %H:%M:%S') if record.timestamp else ''
+            vehicle = record.vehicle
+            operation_type = record.operation_type
+            road = record.road
+            distance = f"{record.distance:.3f}"
+            amount = f"{record.amount:.2f}"
+            bu_number = record.device
             
             html += f"""
             <tr>
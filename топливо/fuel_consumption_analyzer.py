@@ -25,6 +25,201 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Максимальная разница во времени между заправками Крассулы и ГЛОНАСС
+MATCH_TIME_WINDOW = timedelta(hours=2)
+
+# Допустимая разница в количестве литров (доля от заправки Крассулы)
+MATCH_LITERS_TOLERANCE = 0.1
+
+# Заправка ГЛОНАСС без заправки Крассулы ближе этого времени считается только в ГЛОНАСС
+KRASSULA_PRESENCE_WINDOW = timedelta(hours=1)
+
+
+def _min_cost_assignment(cost: np.ndarray) -> np.ndarray:
+    """
+    Решает задачу о назначениях (венгерский алгоритм)
+    
+    Args:
+        cost: Матрица стоимостей n x m, n <= m
+        
+    Returns:
+        np.ndarray: Номер столбца для каждой строки
+    """
+    n, m = cost.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    # row_of[j] - строка (с 1), назначенная столбцу j; столбец 0 фиктивный
+    row_of = np.zeros(m + 1, dtype=int)
+    way = np.zeros(m + 1, dtype=int)
+    
+    for i in range(1, n + 1):
+        row_of[0] = i
+        j0 = 0
+        min_value = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        
+        # Ищем кратчайший увеличивающий путь из строки i
+        while row_of[j0] != 0:
+            used[j0] = True
+            i0 = row_of[j0]
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            improved = ~used[1:] & (reduced < min_value[1:])
+            min_value[1:][improved] = reduced[improved]
+            way[1:][improved] = j0
+            
+            free_values = np.where(used[1:], np.inf, min_value[1:])
+            j1 = int(np.argmin(free_values)) + 1
+            delta = free_values[j1 - 1]
+            u[row_of[used]] += delta
+            v[used] -= delta
+            min_value[~used] -= delta
+            j0 = j1
+        
+        # Перестраиваем назначение вдоль найденного пути
+        while j0 != 0:
+            j1 = way[j0]
+            row_of[j0] = row_of[j1]
+            j0 = j1
+    
+    column_of = np.zeros(n, dtype=int)
+    assigned = np.nonzero(row_of[1:])[0]
+    column_of[row_of[1:][assigned] - 1] = assigned
+    return column_of
+
+
+def assign_refuels(left: np.ndarray, right: np.ndarray, costs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Выбирает из допустимых пар сопоставление один к одному
+    
+    Сначала максимизируется число сопоставленных пар, затем минимизируется
+    их суммарная стоимость. Пары разбиваются на связные компоненты: при
+    узких окнах по времени компоненты малы, и задача о назначениях решается
+    для каждой отдельно, поэтому время растет почти линейно.
+    
+    Args:
+        left: Номера левых элементов пар (заправки Крассулы)
+        right: Номера правых элементов пар (заправки ГЛОНАСС)
+        costs: Стоимости пар; пары с неопределенной стоимостью (NaN, inf) недопустимы
+        
+    Returns:
+        Tuple: Номера левых и правых элементов выбранных пар
+    """
+    finite = np.isfinite(costs)
+    if not finite.all():
+        left, right, costs = left[finite], right[finite], costs[finite]
+    if len(left) == 0:
+        return left, right
+    
+    # Пары без конкурентов выбираются сразу
+    left_ids, left_index = np.unique(left, return_inverse=True)
+    right_ids, right_index = np.unique(right, return_inverse=True)
+    alone = (np.bincount(left_index)[left_index] == 1) & (np.bincount(right_index)[right_index] == 1)
+    chosen_left = [left[alone]]
+    chosen_right = [right[alone]]
+    
+    # Остальные пары - по связным компонентам (система непересекающихся множеств)
+    parent = list(range(len(left_ids) + len(right_ids)))
+    
+    def find(node):
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+    
+    contested = np.nonzero(~alone)[0]
+    for pair in contested:
+        a = find(left_index[pair])
+        b = find(len(left_ids) + right_index[pair])
+        if a != b:
+            parent[a] = b
+    
+    components = {}
+    for pair in contested:
+        components.setdefault(find(left_index[pair]), []).append(pair)
+    
+    for pairs in components.values():
+        pairs = np.array(pairs)
+        rows, row_index = np.unique(left[pairs], return_inverse=True)
+        columns, column_index = np.unique(right[pairs], return_inverse=True)
+        
+        # Отсутствующая пара стоит 0, имеющаяся - стоимость минус штраф
+        # больше любой суммы стоимостей, чтобы число пар было важнее
+        penalty = costs[pairs].sum() + 1
+        cost = np.zeros((len(rows), len(columns)))
+        cost[row_index, column_index] = costs[pairs] - penalty
+        
+        edges = np.zeros(cost.shape, dtype=bool)
+        edges[row_index, column_index] = True
+        if len(rows) <= len(columns):
+            row_positions = np.arange(len(rows))
+            column_positions = _min_cost_assignment(cost)
+        else:
+            column_positions = np.arange(len(columns))
+            row_positions = _min_cost_assignment(cost.T)
+        
+        real = edges[row_positions, column_positions]
+        chosen_left.append(rows[row_positions[real]])
+        chosen_right.append(columns[column_positions[real]])
+    
+    return np.concatenate(chosen_left), np.concatenate(chosen_right)
+
+
+class RefuelTimeIndex:
+    """
+    Отсортированные моменты заправок каждого автомобиля
+    
+    Отвечает на вопросы вида "есть ли у автомобиля заправка ближе
+    заданного времени" бинарным поиском, без перебора всех пар заправок.
+    """
+    
+    def __init__(self, vehicles: pd.Series, times: pd.Series):
+        """
+        Args:
+            vehicles: Номера автомобилей
+            times: Моменты заправок (той же длины, что и vehicles)
+        """
+        frame = pd.DataFrame({
+            'vehicle_number': vehicles.to_numpy(),
+            'datetime': times.to_numpy(dtype='datetime64[ns]')
+        }).dropna()
+        
+        self.times = {
+            vehicle_number: np.sort(group['datetime'].to_numpy())
+            for vehicle_number, group in frame.groupby('vehicle_number', sort=False)
+        }
+    
+    def vehicle_times(self, vehicle_number: str) -> np.ndarray:
+        """Отсортированные моменты заправок автомобиля"""
+        return self.times.get(vehicle_number, np.array([], dtype='datetime64[ns]'))
+    
+    def count_within(self, vehicle_number: str, times: Any, window: timedelta) -> np.ndarray:
+        """
+        Считает заправки автомобиля, отстоящие от каждого момента меньше чем на window
+        
+        Args:
+            vehicle_number: Номер автомобиля
+            times: Моменты для проверки (Series, массив или список)
+            window: Половина ширины окна (границы не включаются)
+            
+        Returns:
+            np.ndarray: Количество заправок в окне для каждого момента
+        """
+        sorted_times = self.vehicle_times(vehicle_number)
+        times = pd.to_datetime(pd.Series(times)).to_numpy(dtype='datetime64[ns]')
+        window = np.timedelta64(window)
+        starts = np.searchsorted(sorted_times, times - window, side='right')
+        ends = np.searchsorted(sorted_times, times + window, side='left')
+        return np.maximum(ends - starts, 0)
+    
+    def has_within(self, vehicle_number: str, times: Any, window: timedelta) -> np.ndarray:
+        """
+        Проверяет, есть ли у автомобиля заправка ближе чем на window к каждому моменту
+        
+        Returns:
+            np.ndarray: Булев массив той же длины, что и times
+        """
+        return self.count_within(vehicle_number, times, window) > 0
+
 class FuelConsumptionAnalyzer:
     """Основной класс для анализа расхода топлива"""
     
@@ -35,6 +230,10 @@ class FuelConsumptionAnalyzer:
         self.card_to_vehicle_mapping = {}
         self.notifications = []
         self.results = {}
+        # Моменты заправок Крассулы по автомобилям (заполняется в match_refuels)
+        self.krassula_time_index = None
+        # Таблица пробега и расхода по заправкам (заполняется в match_refuels)
+        self.consumption_table = None
         
     def load_krassula_data(self, file_path: str) -> bool:
         """
@@ -97,48 +296,7 @@ class FuelConsumptionAnalyzer:
             
             # Обрабатываем данные заправок
             if not self.glonass_refuel_data.empty:
-                # Обрабатываем иерархическую структуру данных
-                processed_data = []
-                current_vehicle = None
-                
-                for _, row in self.glonass_refuel_data.iterrows():
-                    grouping = str(row['Группировка'])
-                    
-                    # Сначала проверяем, является ли это датой
-                    date = self._extract_date_from_grouping(grouping)
-                    if date and current_vehicle:
-                        # Проверяем, что это валидная заправка
-                        if (str(row['Время']) != '-----' and 
-                            str(row['Заправлено']) != '-----' and 
-                            str(row['Пробег']) != '-----'):
-                            
-                            # Это заправка для текущего автомобиля
-                            processed_row = row.copy()
-                            processed_row['vehicle_number'] = current_vehicle
-                            processed_row['date'] = date
-                            
-                            # Очищаем время от даты, если она там есть
-                            time_str = str(row['Время'])
-                            time_cleaned = re.search(r'(\d{2}:\d{2}:\d{2})', time_str)
-                            if time_cleaned:
-                                time_str = time_cleaned.group(1)
-                            
-                            processed_row['datetime'] = pd.to_datetime(date + ' ' + time_str)
-                            processed_data.append(processed_row)
-                        continue
-                    
-                    # Проверяем, является ли это названием автомобиля
-                    vehicle_number = self._extract_vehicle_number(grouping)
-                    if vehicle_number and vehicle_number != "None":
-                        current_vehicle = vehicle_number
-                        continue
-                
-                # Создаем новый DataFrame с обработанными данными
-                if processed_data:
-                    self.glonass_refuel_data = pd.DataFrame(processed_data)
-                else:
-                    self.glonass_refuel_data = pd.DataFrame()
-                
+                self.glonass_refuel_data = self._process_glonass_refuels(self.glonass_refuel_data)
                 logger.info(f"Загружено {len(self.glonass_refuel_data)} записей заправок из ГЛОНАСС")
             
             # Обрабатываем данные сливов
@@ -159,7 +317,76 @@ class FuelConsumptionAnalyzer:
         except Exception as e:
             logger.error(f"Ошибка при загрузке данных ГЛОНАСС: {e}")
             return False
-    
+
+    def _process_glonass_refuels(self, sheet: pd.DataFrame) -> pd.DataFrame:
+        """
+        Разбирает иерархический лист заправок ГЛОНАСС
+
+        Строка с названием автомобиля открывает группу, за ней идут строки
+        с датой заправки в колонке "Группировка". Разбор выполняется
+        операциями над колонками целиком, без обхода строк.
+
+        Args:
+            sheet: Лист "Заправки и зарядки батареи" как есть
+
+        Returns:
+            pd.DataFrame: Заправки с колонками vehicle_number, date и datetime
+        """
+        grouping = sheet['Группировка'].astype(str)
+
+        # Строки с датой в группировке — заправки
+        dates = pd.to_datetime(
+            grouping.str.extract(r'(\d{1,2}\.\d{1,2}\.\d{4})', expand=False),
+            format='%d.%m.%Y', errors='coerce'
+        )
+        is_date = dates.notna()
+
+        # Остальные строки с номером — заголовки автомобилей, номер
+        # распространяется на следующие за ним строки
+        vehicles = self._extract_vehicle_numbers(grouping).where(~is_date)
+        current_vehicle = vehicles.ffill()
+
+        # Заправка должна относиться к автомобилю и иметь время, объем и пробег
+        valid = is_date & current_vehicle.notna()
+        for column in ('Время', 'Заправлено', 'Пробег'):
+            valid &= sheet[column].astype(str) != '-----'
+
+        if not valid.any():
+            return pd.DataFrame()
+
+        refuels = sheet[valid].infer_objects()
+        refuels['vehicle_number'] = current_vehicle[valid]
+        refuels['date'] = dates[valid].dt.strftime('%Y-%m-%d')
+
+        # Очищаем время от даты, если она там есть
+        time_str = refuels['Время'].astype(str)
+        time_str = time_str.str.extract(r'(\d{2}:\d{2}:\d{2})', expand=False).fillna(time_str)
+        refuels['datetime'] = dates[valid] + pd.to_timedelta(time_str)
+
+        return refuels
+
+    def _extract_vehicle_numbers(self, grouping: pd.Series) -> pd.Series:
+        """
+        Извлекает номера автомобилей из колонки группировки
+
+        Работает как _extract_vehicle_number, но для всей колонки сразу
+
+        Args:
+            grouping: Колонка с текстами группировки
+
+        Returns:
+            pd.Series: Номера автомобилей, NaN где номера нет
+        """
+        # Номер вида "т497ес797" -> первые цифры (497)
+        numbers = grouping.str.lower().str.extract(r'[а-яё](\d+)[а-яё]+\d+', expand=False)
+
+        # Иначе последние цифры, кроме годов (4 цифры) и одиночных цифр
+        digits = grouping.str.extractall(r'(\d+)')[0]
+        lengths = digits.str.len()
+        fallback = digits[(lengths != 4) & (lengths > 1)].groupby(level=0).last()
+
+        return numbers.fillna(fallback.reindex(grouping.index))
+
     def _extract_vehicle_number(self, grouping_text: str) -> Optional[str]:
         """
         Извлекает номер автомобиля из текста группировки
@@ -290,69 +517,31 @@ class FuelConsumptionAnalyzer:
         
         results = {}
         
-        # Группируем данные Крассулы по автомобилям
-        krassula_by_vehicle = {}
+        # Заправки Крассулы с номерами автомобилей
+        krassula = self._krassula_refuels()
+        
+        # Сопоставляем с данными ГЛОНАСС сразу по всем автомобилям
+        krassula['glonass_position'] = self._match_glonass_refuels(krassula)
+        glonass_records = self.glonass_refuel_data.to_dict('records')
         
-        for _, row in self.krassula_data.iterrows():
-            # Извлекаем номер карты из колонки "Номер карты" (последние 4 цифры)
-            card_full = str(row['Номер карты'])
-            card_number = self._extract_card_number(card_full)
+        for vehicle_number, group in krassula.groupby('vehicle_number', sort=False):
+            krassula_refuels = group.drop(columns=['vehicle_number', 'glonass_position']).to_dict('records')
+            results[vehicle_number] = []
             
-            if card_number and card_number in self.card_to_vehicle_mapping:
-                vehicle_number = self.card_to_vehicle_mapping[card_number]
-                
-                if vehicle_number not in krassula_by_vehicle:
-                    krassula_by_vehicle[vehicle_number] = []
-                
-                krassula_by_vehicle[vehicle_number].append({
-                    'datetime': row['Дата и время'],
-                    'liters': row['Кол-во литров'],
-                    'price': row['Цена со скидкой'],
-                    'amount': row['Сумма со скидкой'],
-                    'azs': row['АЗС'],
-                    'card_number': card_number
-                })
-            else:
-                # Карта не найдена в соответствиях - это нормально для карт других компаний
-                logger.debug(f"Карта {card_number} не найдена в соответствиях (возможно, карта другой компании)")
-        
-        # Сопоставляем с данными ГЛОНАСС
-        for vehicle_number, krassula_refuels in krassula_by_vehicle.items():
-            if vehicle_number not in results:
-                results[vehicle_number] = []
-            
-            # Получаем данные ГЛОНАСС для этого автомобиля
-            glonass_refuels = self.glonass_refuel_data[
-                self.glonass_refuel_data['vehicle_number'] == vehicle_number
-            ].copy()
-            
-            # Сопоставляем каждую заправку
-            for krassula_refuel in krassula_refuels:
-                matched_refuel = self._find_matching_refuel(
-                    krassula_refuel, glonass_refuels
-                )
+            for krassula_refuel, position in zip(krassula_refuels, group['glonass_position']):
+                matched_refuel = glonass_records[position] if position >= 0 else None
                 
                 if matched_refuel:
-                    # Рассчитываем пробег с предыдущей заправки
-                    prev_refuels = results[vehicle_number] if vehicle_number in results else []
-                    prev_odometer = prev_refuels[-1]['odometer'] if prev_refuels and 'odometer' in prev_refuels[-1] else None
-                    
-                    # Пробег между заправками
-                    odometer = matched_refuel['Пробег']
-                    probeg = odometer - prev_odometer if prev_odometer else 0
-                    
-                    # Расчет расхода топлива
-                    consumption = round((krassula_refuel['liters'] / probeg * 100) if probeg > 0 else 0, 2)
-                    
-                    # Заправка найдена в обеих системах
+                    # Заправка найдена в обеих системах, пробег и расход
+                    # заполняются ниже по таблице расхода
                     result = {
                         'date': krassula_refuel['datetime'],
                         'krassula_liters': krassula_refuel['liters'],
                         'glonass_liters': matched_refuel['Заправлено'],
                         'difference': krassula_refuel['liters'] - matched_refuel['Заправлено'],
-                        'odometer': odometer,
-                        'probeg': probeg,
-                        'consumption': consumption,
+                        'odometer': matched_refuel['Пробег'],
+                        'probeg': 0,
+                        'consumption': 0,
                         'final_fuel_level': matched_refuel.get('Кон. уровень топлива', ''),
                         'status': 'matched',
                         'azs': krassula_refuel['azs'],
@@ -381,31 +570,37 @@ class FuelConsumptionAnalyzer:
                 results[vehicle_number].append(result)
         
         # Проверяем заправки только в ГЛОНАСС
+        self.krassula_time_index = RefuelTimeIndex(krassula['vehicle_number'], krassula['datetime'])
         glonass_refuels = self.glonass_refuel_data
-        for vehicle_number in glonass_refuels['vehicle_number'].unique():
-            if pd.isna(vehicle_number):
-                continue
-                
-            vehicle_glonass = glonass_refuels[
-                glonass_refuels['vehicle_number'] == vehicle_number
-            ]
-            
-            for _, glonass_refuel in vehicle_glonass.iterrows():
-                # Проверяем, есть ли соответствующая заправка в Крассуле
-                found_in_krassula = any(
-                    abs((glonass_refuel['datetime'] - krassula_refuel['datetime']).total_seconds()) < 3600
-                    for krassula_refuel in krassula_by_vehicle.get(vehicle_number, [])
+        if not glonass_refuels.empty:
+            for vehicle_number, vehicle_glonass in glonass_refuels.groupby('vehicle_number', sort=False):
+                # Есть ли заправка в Крассуле в пределах часа
+                found_in_krassula = self.krassula_time_index.has_within(
+                    vehicle_number, vehicle_glonass['datetime'], KRASSULA_PRESENCE_WINDOW
                 )
                 
-                if not found_in_krassula:
+                missing = vehicle_glonass[~found_in_krassula]
+                for date, liters in zip(missing['datetime'].to_list(), missing['Заправлено'].to_list()):
                     self.notifications.append({
                         'type': 'missing_krassula',
                         'vehicle': vehicle_number,
-                        'date': glonass_refuel['datetime'],
-                        'message': f"Заправка {glonass_refuel['Заправлено']}л найдена только в ГЛОНАСС"
+                        'date': date,
+                        'message': f"Заправка {liters}л найдена только в ГЛОНАСС"
                     })
         
         self.results = results
+        
+        # Пробег и расход с предыдущей сопоставленной заправки
+        self.consumption_table = self._build_consumption_table()
+        consumption_rows = self.consumption_table[self.consumption_table['distance'].notna()]
+        for vehicle_number, position, distance, consumption in zip(
+            consumption_rows['vehicle_number'], consumption_rows['position'],
+            consumption_rows['distance'], consumption_rows['consumption']
+        ):
+            result = results[vehicle_number][position]
+            result['probeg'] = distance
+            result['consumption'] = consumption if pd.notna(consumption) else 0
+        
         logger.info(f"Сопоставление завершено для {len(results)} автомобилей")
         return results
     
@@ -421,38 +616,142 @@ class FuelConsumptionAnalyzer:
         
         return None
     
-    def _find_matching_refuel(self, krassula_refuel: Dict, glonass_refuels: pd.DataFrame) -> Optional[Dict]:
+    def _krassula_refuels(self) -> pd.DataFrame:
         """
-        Находит соответствующую заправку в данных ГЛОНАСС
+        Выбирает заправки Крассулы по картам из соответствий
         
-        Args:
-            krassula_refuel: Данные заправки из Крассулы
-            glonass_refuels: DataFrame с заправками из ГЛОНАСС
-            
         Returns:
-            Dict: Найденная заправка или None
+            pd.DataFrame: Заправки с номером автомобиля в исходном порядке
         """
-        if glonass_refuels.empty:
-            return None
-        
-        # Ищем заправку в пределах 2 часов
-        time_diff = abs(glonass_refuels['datetime'] - krassula_refuel['datetime'])
-        time_mask = time_diff <= timedelta(hours=2)
-        
-        if not time_mask.any():
-            return None
+        # Номер карты — последние 4 цифры колонки "Номер карты"
+        cards = self.krassula_data['Номер карты'].astype(str).str.strip()
+        card_numbers = cards.str[-4:].where(cards.str.len() >= 4)
+        vehicles = card_numbers.map(self.card_to_vehicle_mapping)
+        
+        # Карты других компаний в соответствиях отсутствуют - это нормально
+        unknown_cards = card_numbers[vehicles.isna()].dropna().unique()
+        if len(unknown_cards):
+            logger.debug(f"Карты {list(unknown_cards)} не найдены в соответствиях (возможно, карты другой компании)")
+        
+        refuels = pd.DataFrame({
+            'vehicle_number': vehicles,
+            'datetime': self.krassula_data['Дата и время'],
+            'liters': self.krassula_data['Кол-во литров'],
+            'price': self.krassula_data['Цена со скидкой'],
+            'amount': self.krassula_data['Сумма со скидкой'],
+            'azs': self.krassula_data['АЗС'],
+            'card_number': card_numbers
+        })
+        return refuels[vehicles.notna()]
+    
+    def _match_glonass_refuels(self, krassula: pd.DataFrame) -> np.ndarray:
+        """
+        Находит для заправок Крассулы соответствующие заправки ГЛОНАСС
         
-        # Ищем по количеству литров (с учетом погрешности ±10%)
-        liters_diff = abs(glonass_refuels['Заправлено'] - krassula_refuel['liters'])
-        liters_mask = liters_diff <= krassula_refuel['liters'] * 0.1
+        Заправки ГЛОНАСС каждого автомобиля сортируются по времени, окно
+        ±MATCH_TIME_WINDOW вокруг заправки Крассулы находится бинарным
+        поиском, и объем в литрах проверяется только у заправок в окне.
+        Подходящие пары распределяются один к одному (см. assign_refuels):
+        каждая заправка ГЛОНАСС соответствует не более чем одной транзакции.
         
-        # Ищем пересечение по времени и количеству
-        final_mask = time_mask & liters_mask
+        Args:
+            krassula: Заправки Крассулы (см. _krassula_refuels)
+            
+        Returns:
+            np.ndarray: Позиции строк в glonass_refuel_data, -1 если заправка не найдена
+        """
+        positions = np.full(len(krassula), -1)
+        glonass = self.glonass_refuel_data
+        if krassula.empty or glonass.empty:
+            return positions
+        
+        krassula_times = krassula['datetime'].to_numpy(dtype='datetime64[ns]')
+        krassula_liters = krassula['liters'].to_numpy(dtype=float)
+        glonass_times = glonass['datetime'].to_numpy(dtype='datetime64[ns]')
+        glonass_liters = pd.to_numeric(glonass['Заправлено'], errors='coerce').to_numpy(dtype=float)
+        window = np.timedelta64(MATCH_TIME_WINDOW)
+        
+        glonass_by_vehicle = pd.Series(np.arange(len(glonass))).groupby(glonass['vehicle_number'].to_numpy()).indices
+        krassula_by_vehicle = pd.Series(np.arange(len(krassula))).groupby(krassula['vehicle_number'].to_numpy()).indices
+        
+        for vehicle_number, krassula_rows in krassula_by_vehicle.items():
+            glonass_rows = glonass_by_vehicle.get(vehicle_number)
+            if glonass_rows is None:
+                continue
+            
+            # Заправки ГЛОНАСС автомобиля по времени
+            glonass_rows = glonass_rows[np.argsort(glonass_times[glonass_rows], kind='stable')]
+            sorted_times = glonass_times[glonass_rows]
+            
+            # Пары (заправка Крассулы, заправка ГЛОНАСС в пределах окна)
+            times = krassula_times[krassula_rows]
+            starts = np.searchsorted(sorted_times, times - window, side='left')
+            ends = np.searchsorted(sorted_times, times + window, side='right')
+            counts = ends - starts
+            pair_krassula = np.repeat(krassula_rows, counts)
+            offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            pair_glonass = glonass_rows[np.repeat(starts, counts) + offsets]
+            
+            # Проверяем количество литров (с учетом погрешности ±10%)
+            liters = krassula_liters[pair_krassula]
+            liters_error = np.abs(glonass_liters[pair_glonass] - liters)
+            fits = liters_error <= liters * MATCH_LITERS_TOLERANCE
+            pair_krassula = pair_krassula[fits]
+            pair_glonass = pair_glonass[fits]
+            
+            # Ошибка пары: доли допустимых расхождений по времени и по литрам.
+            # У заправки Крассулы на 0 л допуск нулевой, подходят только
+            # заправки ГЛОНАСС на 0 л, и ошибка по литрам у них равна 0
+            time_error = np.abs(glonass_times[pair_glonass] - krassula_times[pair_krassula]) / window
+            allowed_error = liters[fits] * MATCH_LITERS_TOLERANCE
+            liters_share = np.divide(
+                liters_error[fits], allowed_error,
+                out=np.zeros(len(allowed_error)), where=allowed_error > 0
+            )
+            costs = time_error + liters_share
+            
+            chosen_krassula, chosen_glonass = assign_refuels(pair_krassula, pair_glonass, costs)
+            positions[chosen_krassula] = chosen_glonass
+        
+        return positions
+    
+    def _build_consumption_table(self) -> pd.DataFrame:
+        """
+        Строит таблицу расхода по результатам сопоставления
         
-        if final_mask.any():
-            return glonass_refuels[final_mask].iloc[0].to_dict()
+        Заправки каждого автомобиля сортируются по дате. Для сопоставленных
+        заправок с пробегом предыдущий пробег берется прямым заполнением
+        среди сопоставленных заправок того же автомобиля, затем по колонкам
+        целиком считаются пробег между заправками и расход на 100 км.
         
-        return None
+        Returns:
+            pd.DataFrame: Заправки с колонками prev_odometer, distance и consumption;
+            position - номер заправки в self.results[vehicle_number]
+        """
+        table = pd.DataFrame(
+            [
+                (vehicle_number, position, refuel['date'], refuel['krassula_liters'],
+                 refuel['odometer'], refuel['difference'], refuel['status'])
+                for vehicle_number, refuels in self.results.items()
+                for position, refuel in enumerate(refuels)
+            ],
+            columns=['vehicle_number', 'position', 'date', 'liters', 'odometer', 'difference', 'status']
+        )
+        table['odometer'] = pd.to_numeric(table['odometer'], errors='coerce')
+        table['liters'] = pd.to_numeric(table['liters'], errors='coerce')
+        table = table.sort_values(['vehicle_number', 'date'], kind='stable').reset_index(drop=True)
+        
+        matched = (table['status'] == 'matched') & table['odometer'].notna()
+        matched_odometer = table['odometer'].where(matched)
+        vehicles = table['vehicle_number']
+        
+        # Пробег последней сопоставленной заправки до текущей
+        table['prev_odometer'] = matched_odometer.groupby(vehicles).ffill().groupby(vehicles).shift()
+        table['distance'] = (table['odometer'] - table['prev_odometer']).where(matched)
+        table['consumption'] = (table['liters'] / table['distance'] * 100).where(table['distance'] > 0).round(2)
+        table['matched'] = matched
+        
+        return table
     
     def calculate_fuel_consumption(self) -> Dict[str, List[Dict]]:
         """
@@ -463,51 +762,28 @@ class FuelConsumptionAnalyzer:
         """
         logger.info("Начинаем расчет расхода топлива...")
         
-        consumption_results = {}
+        if self.consumption_table is None:
+            self.consumption_table = self._build_consumption_table()
         
+        table = self.consumption_table[self.consumption_table['matched']]
+        
+        # Колонки таблицы списками, пропуски -> None
+        columns = {}
+        for column in ('date', 'liters', 'odometer', 'distance', 'consumption', 'difference', 'status'):
+            values = table[column].to_list()
+            if table[column].hasnans:
+                values = [None if pd.isna(value) else value for value in values]
+            columns[column] = values
+        
+        rows_by_vehicle = {}
+        for row in zip(table['vehicle_number'].to_list(), *columns.values()):
+            rows_by_vehicle.setdefault(row[0], []).append(dict(zip(columns, row[1:])))
+        
+        consumption_results = {}
         for vehicle_number, refuels in self.results.items():
             if not refuels:
                 continue
-            
-            # Сортируем заправки по дате
-            refuels_sorted = sorted(refuels, key=lambda x: x['date'])
-            
-            consumption_data = []
-            
-            for i, refuel in enumerate(refuels_sorted):
-                if refuel['status'] != 'matched' or refuel['odometer'] is None:
-                    continue
-                
-                # Находим предыдущую заправку с пробегом
-                prev_odometer = None
-                for j in range(i-1, -1, -1):
-                    if (refuels_sorted[j]['status'] == 'matched' and 
-                        refuels_sorted[j]['odometer'] is not None):
-                        prev_odometer = refuels_sorted[j]['odometer']
-                        break
-                
-                if prev_odometer is not None:
-                    # Рассчитываем расход
-                    distance = refuel['odometer'] - prev_odometer
-                    if distance > 0:
-                        consumption = (refuel['krassula_liters'] / distance) * 100
-                        consumption = round(consumption, 2)
-                    else:
-                        consumption = None
-                else:
-                    consumption = None
-                
-                consumption_data.append({
-                    'date': refuel['date'],
-                    'liters': refuel['krassula_liters'],
-                    'odometer': refuel['odometer'],
-                    'distance': refuel['odometer'] - prev_odometer if prev_odometer else None,
-                    'consumption': consumption,
-                    'difference': refuel['difference'],
-                    'status': refuel['status']
-                })
-            
-            consumption_results[vehicle_number] = consumption_data
+            consumption_results[vehicle_number] = rows_by_vehicle.get(vehicle_number, [])
         
         logger.info(f"Расчет расхода завершен для {len(consumption_results)} автомобилей")
         return consumption_results